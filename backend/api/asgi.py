@@ -0,0 +1,355 @@
+"""ASGI-развёртывание и асинхронный быстрый путь для кэша ответов.
+
+Django 2.2 не умеет асинхронные вьюхи, поэтому под ASGI всё приложение
+работает как WSGI в собственном пуле из ASGI_THREADS потоков. Тело
+запроса читается из ASGI по мере того, как его читает Django, а запрос
+с Content-Length больше допустимого отклоняется сразу. Обычный ответ
+Django уже целиком в памяти и отдаётся клиенту из цикла событий:
+медленный клиент держит корутину, а не поток Django. Потоковый ответ
+уходит кусками через короткую очередь. Перед всем этим стоит обёртка,
+которая сама отвечает на анонимные GET и HEAD к спискам и карточкам
+вьюсетов с AnonymousCacheMixin, если ответ уже лежит в кэше, не занимая
+потоки Django вовсе. Промахи, условные запросы, запросы с авторизацией
+и всё остальное уходят в Django как есть.
+"""
+import asyncio
+import io
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+
+from .cache import (CACHE_CONTROL, RESPONSE_KEY, VARY, AnonymousCacheMixin,
+                    count, get_versions, response_key, validators)
+from .metrics import registry
+
+CACHED_ACTIONS = {'list', 'retrieve'}
+JSON_TYPES = {'application/json', 'application/*', '*/*'}
+BYPASS_HEADERS = {b'authorization', b'if-none-match', b'if-modified-since'}
+STREAM_QUEUE_SIZE = 16
+TOO_LARGE = {'detail': 'Тело запроса слишком большое.'}
+
+
+def accepts_json(accept):
+    """Выберет ли DRF для такого Accept JSONRenderer, а не HTML."""
+    if not accept:
+        return True
+    types = {item.split(';')[0].strip() for item in accept.split(',')}
+    return 'text/html' not in types and bool(types & JSON_TYPES)
+
+
+def cached_view(scope):
+    """Имя вьюхи и пространства имён кэша, если запрос можно отдать сразу."""
+    if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+        return None
+    headers = dict(scope['headers'])
+    if BYPASS_HEADERS.intersection(headers):
+        return None
+    if not accepts_json(headers.get(b'accept', b'').decode('latin-1')):
+        return None
+    if b'format=' in scope['query_string']:
+        return None
+    try:
+        match = resolve(scope['path'])
+    except Resolver404:
+        return None
+    view = getattr(match.func, 'cls', None)
+    actions = getattr(match.func, 'actions', None) or {}
+    if (view is None or not issubclass(view, AnonymousCacheMixin)
+            or actions.get('get') not in CACHED_ACTIONS):
+        return None
+    return match.view_name, view.cache_namespaces
+
+
+def lookup(scope, namespaces):
+    """Готовое тело ответа из кэша AnonymousCacheMixin или None.
+
+    Ключ считается по запросу Django из того же environ, что получила бы
+    вьюха, так что адрес сайта в нём совпадает.
+    """
+    request = WSGIRequest(build_environ(scope, BytesIO()))
+    try:
+        request.get_host()
+    except DisallowedHost:
+        return None
+    versions = get_versions(namespaces)
+    key = response_key(request, versions)
+    entry = cache.get(RESPONSE_KEY.format(key))
+    if entry is None:
+        return None
+    count('hits')
+    created, data = entry
+    return JSONRenderer().render(data), validators(key, created)
+
+
+def build_environ(scope, body):
+    """WSGI environ для HTTP-запроса ASGI."""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('server'):
+        environ['SERVER_NAME'] = scope['server'][0]
+        environ['SERVER_PORT'] = str(scope['server'][1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[name] = (
+            f'{environ[name]},{value}' if name in environ else value
+        )
+    return environ
+
+
+def body_limit():
+    """Наибольшее тело запроса, которое может принять вьюха, или None.
+
+    Картинка рецепта приходит файлом или в base64 внутри JSON, поэтому
+    к DATA_UPLOAD_MAX_MEMORY_SIZE добавляется RECIPE_IMAGE_MAX_SIZE
+    в base64.
+    """
+    if settings.DATA_UPLOAD_MAX_MEMORY_SIZE is None:
+        return None
+    return (
+        settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        + math.ceil(settings.RECIPE_IMAGE_MAX_SIZE / 3) * 4
+    )
+
+
+def content_length(scope):
+    for name, value in scope['headers']:
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input, который получает тело из ASGI по мере чтения.
+
+    Читается из потока Django: каждое сообщение запрашивается у цикла
+    событий, когда прочитанное раньше закончилось.
+    """
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.pending = b''
+        self.more_body = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and self.more_body:
+            message = asyncio.run_coroutine_threadsafe(
+                self.receive(), self.loop
+            ).result()
+            if message['type'] == 'http.disconnect':
+                self.more_body = False
+                break
+            self.pending = message.get('body', b'')
+            self.more_body = message.get('more_body', False)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class ResponseChannel:
+    """Сообщения ответа из потока Django в цикл событий.
+
+    Очередь ограничена: поток, отдающий потоковый ответ быстрее, чем его
+    принимает клиент, ждёт, а не копит ответ в памяти. После close поток
+    получает ConnectionAbortedError при следующей отправке.
+    """
+
+    def __init__(self, loop, size=STREAM_QUEUE_SIZE):
+        self.loop = loop
+        self.queue = asyncio.Queue(size)
+        self.closed = False
+
+    def put(self, message):
+        if self.closed:
+            raise ConnectionAbortedError('Клиент не принимает ответ.')
+        asyncio.run_coroutine_threadsafe(
+            self.queue.put(message), self.loop
+        ).result()
+
+    def close(self):
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+def run_wsgi(application, environ, channel):
+    """Выполняет WSGI-приложение и передаёт ответ в channel.
+
+    Обычный ответ уходит одним сообщением с Content-Length, потоковый -
+    кусками по мере того, как их отдаёт Django. Значения заголовков
+    обрезаются: Django 2.2 ставит пробел в начале Set-Cookie,
+    WSGI-серверы это терпят, а h11 под uvicorn нет.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [
+            (name.lower().encode('latin-1'), value.strip().encode('latin-1'))
+            for name, value in headers
+        ]
+
+    result = application(environ, start_response)
+    try:
+        start = {
+            'type': 'http.response.start',
+            'status': response['status'],
+            'headers': response['headers'],
+        }
+        if getattr(result, 'streaming', False):
+            channel.put(start)
+            for chunk in result:
+                if chunk:
+                    channel.put({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            channel.put({'type': 'http.response.body', 'body': b''})
+            return
+        body = b''.join(result)
+        if not any(name == b'content-length'
+                   for name, _ in start['headers']):
+            start['headers'].append(
+                (b'content-length', str(len(body)).encode())
+            )
+        channel.put(start)
+        channel.put({'type': 'http.response.body', 'body': body})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+async def send_response(scope, send, status, headers, body):
+    await send({
+        'type': 'http.response.start', 'status': status, 'headers': headers
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': b'' if scope['method'] == 'HEAD' else body,
+    })
+
+
+class ThreadPoolApplication:
+    """ASGI-приложение из WSGI-приложения Django.
+
+    Свой пул вместо asgiref.wsgi.WsgiToAsgi: начиная с asgiref 3.3 тот
+    по умолчанию выполняет все запросы процесса в одном потоке.
+    """
+
+    def __init__(self, application, threads=None):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or settings.ASGI_THREADS,
+            thread_name_prefix='django'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип ASGI: {scope["type"]}')
+        limit = body_limit()
+        length = content_length(scope)
+        if limit is not None and length is not None and length > limit:
+            body = JSONRenderer().render(TOO_LARGE)
+            await send_response(scope, send, 413, [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'connection', b'close'),
+            ], body)
+            return
+        loop = asyncio.get_running_loop()
+        channel = ResponseChannel(loop)
+        environ = build_environ(
+            scope, io.BufferedReader(RequestBody(receive, loop))
+        )
+        future = loop.run_in_executor(
+            self.executor, self.respond, environ, channel
+        )
+        try:
+            while True:
+                message = await channel.queue.get()
+                if message is None:
+                    break
+                if scope['method'] == 'HEAD' and message.get('body'):
+                    message = {**message, 'body': b''}
+                await send(message)
+        finally:
+            channel.close()
+        await future
+
+    def respond(self, environ, channel):
+        try:
+            run_wsgi(self.application, environ, channel)
+        finally:
+            if not channel.closed:
+                channel.put(None)
+
+
+class CachedResponseApplication:
+    """ASGI-обёртка, отдающая попадания в кэш ответов без Django."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        cached = cached_view(scope)
+        if cached is not None:
+            start = time.perf_counter()
+            view, namespaces = cached
+            found = await asyncio.get_running_loop().run_in_executor(
+                None, lookup, scope, namespaces
+            )
+            if found is not None:
+                await self.respond(scope, send, *found)
+                registry.record(
+                    view, scope['method'], 200, time.perf_counter() - start
+                )
+                return
+        await self.application(scope, receive, send)
+
+    @staticmethod
+    async def respond(scope, send, body, headers):
+        await send_response(scope, send, 200, [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'etag', headers['ETag'].encode()),
+            (b'last-modified', headers['Last-Modified'].encode()),
+            (b'cache-control', CACHE_CONTROL.encode()),
+            (b'vary', ', '.join(VARY).encode()),
+            (b'x-cache', b'HIT'),
+        ], body)
@@ -0,0 +1,182 @@
+"""Аутентификация по токену с кэшем токен -> пользователь.
+
+TokenAuthentication из DRF на каждый запрос делает выборку Token JOIN
+User. Если включено TOKEN_CACHE_SHARED и кэш Django общий для всех
+процессов (CACHE_SHARED), строка пользователя кэшируется в нём, а с
+TOKEN_CACHE_LOCAL ещё и в памяти процесса (LRU с ограниченным размером
+и временем жизни). Записи сбрасываются при удалении токена (выход
+через djoser), смене пароля и любом другом изменении пользователя:
+строка удаляется из общего кэша, а номер поколения токена в нём
+увеличивается. Запись в памяти процесса годится, только пока поколение
+в общем кэше то же, так что отозванный токен сразу перестают принимать
+все процессы. С кэшем в памяти процесса (LocMemCache) токены не
+кэшируются: другие воркеры не узнали бы об отзыве.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+SHARED_KEY = 'api_auth:token:v2:{}'
+GENERATION_KEY = 'api_auth:token:generation:{}'
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname not in User.COUNTERS and field.attname != 'password'
+)
+
+
+def token_hash(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def shared_key(key):
+    return SHARED_KEY.format(token_hash(key))
+
+
+def generation_key(key):
+    return GENERATION_KEY.format(token_hash(key))
+
+
+class TokenCache:
+    """LRU токен -> (поколение, дата создания токена, поля пользователя)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def count(self, event):
+        with self.lock:
+            self.stats[event] += 1
+
+    @staticmethod
+    def enabled():
+        return settings.TOKEN_CACHE_SHARED and settings.CACHE_SHARED
+
+    def get(self, key):
+        if not self.enabled():
+            self.count('misses')
+            return None
+        local = settings.TOKEN_CACHE_LOCAL
+        row = self.get_local(key) if local else None
+        if row is not None:
+            self.count('local_hits')
+            return row
+        cached = cache.get_many([shared_key(key), generation_key(key)])
+        row = cached.get(shared_key(key))
+        if row is None:
+            self.count('misses')
+            return None
+        self.count('shared_hits')
+        if local:
+            self.remember(key, cached.get(generation_key(key)), row)
+        return row
+
+    def get_local(self, key):
+        """Запись процесса, если поколение токена с тех пор не сменилось."""
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        current = cache.get(generation_key(key)) == entry[1]
+        with self.lock:
+            if self.entries.get(key) is not entry:
+                return None
+            if not current:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return entry[2]
+
+    def remember(self, key, generation, row):
+        expires = time.monotonic() + settings.TOKEN_CACHE_TIMEOUT
+        with self.lock:
+            self.entries[key] = (expires, generation, row)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def set(self, key, row):
+        if not self.enabled():
+            return
+        cache.set(shared_key(key), row, settings.TOKEN_CACHE_TIMEOUT)
+
+    def discard(self, keys):
+        """Отзывает токены во всех процессах после коммита транзакции."""
+        keys = list(keys)
+
+        def drop():
+            with self.lock:
+                for key in keys:
+                    self.entries.pop(key, None)
+            if not self.enabled():
+                return
+            cache.delete_many([shared_key(key) for key in keys])
+            for key in keys:
+                self.bump(generation_key(key))
+        if keys:
+            transaction.on_commit(drop)
+
+    @staticmethod
+    def bump(key):
+        # Поколение живёт дольше любой записи, прочитанной до отзыва.
+        cache.add(key, 0, settings.TOKEN_CACHE_TIMEOUT)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, settings.TOKEN_CACHE_TIMEOUT)
+
+    def discard_user(self, user_id):
+        self.discard(Token.objects.filter(
+            user_id=user_id
+        ).values_list('key', flat=True))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self.entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        hits = stats['local_hits'] + stats['shared_hits']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        return stats
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который ходит в базу только при промахе кэша."""
+
+    def authenticate_credentials(self, key):
+        row = token_cache.get(key)
+        if row is None:
+            row = Token.objects.filter(key=key).values_list(
+                'created', *(f'user__{name}' for name in USER_FIELDS)
+            ).first()
+            if row is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not row[1 + USER_FIELDS.index('is_active')]:
+                raise exceptions.AuthenticationFailed(
+                    _('User inactive or deleted.')
+                )
+            token_cache.set(key, row)
+        using = router.db_for_read(User)
+        user = User.from_db(using, USER_FIELDS, row[1:])
+        token = Token.from_db(
+            using, ('key', 'user_id', 'created'), (key, user.pk, row[0])
+        )
+        token.user = user
+        return user, token
@@ -0,0 +1,168 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
+from foodgram import replicas
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'api_cache:version:{}'
+RESPONSE_KEY = 'api_cache:response:{}'
+STATS_KEY = 'api_cache:{}'
+CACHE_CONTROL = 'no-cache'
+VARY = ('Accept', 'Authorization')
+
+
+def invalidate(*namespaces, pin=True):
+    """Сбрасывает закэшированные ответы пространств имён после коммита.
+
+    pin=False не переводит чтения всех пользователей на основную базу:
+    для частых изменений, где ответ из отставшей реплики допустим.
+    """
+    def bump():
+        if pin:
+            replicas.pin()
+        version = time.time()
+        cache.set_many(
+            {VERSION_KEY.format(namespace): version
+             for namespace in namespaces},
+            None
+        )
+    transaction.on_commit(bump)
+
+
+def get_versions(namespaces):
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    for key, version in missing.items():
+        cache.add(key, version, None)
+    if missing:
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def response_key(request, versions):
+    """Ключ ответа: адрес сайта, путь, отсортированные параметры и версии.
+
+    Адрес сайта входит в ключ, потому что ссылки на картинки в ответах
+    абсолютные.
+    """
+    return hashlib.md5('|'.join((
+        request.build_absolute_uri('/'),
+        request.path,
+        urlencode(sorted(request.GET.lists()), doseq=True),
+        *map(repr, versions),
+    )).encode()).hexdigest()
+
+
+def validators(key, created):
+    """ETag и Last-Modified записи кэша, созданной в момент created.
+
+    ETag меняется с каждой новой записью, в том числе после истечения
+    её времени жизни, а не только со сменой версий.
+    """
+    return {
+        'ETag': quote_etag(f'{key}-{int(created * 1000):x}'),
+        'Last-Modified': http_date(created),
+    }
+
+
+def no_shared_reuse(response):
+    """Ответ анонимному пользователю не годится для запроса с токеном."""
+    response['Cache-Control'] = CACHE_CONTROL
+    patch_vary_headers(response, VARY)
+    return response
+
+
+def count(event):
+    key = STATS_KEY.format(event)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_stats():
+    hits = cache.get(STATS_KEY.format('hits'), 0)
+    misses = cache.get(STATS_KEY.format('misses'), 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+class AnonymousCacheMixin:
+    """Кэширует list и retrieve для анонимных пользователей.
+
+    Ключ складывается из адреса сайта, пути, отсортированных параметров
+    запроса и версий пространств имён cache_namespaces. Версии меняются
+    сигналами изменения моделей, так что устаревшие записи просто
+    перестают читаться. Счётчики избранного, корзины и подписчиков
+    меняются слишком часто, чтобы сбрасывать по ним кэш: вьюхи, в ответах
+    которых они есть, ограничивают время жизни записи через
+    get_cache_timeout. Запись хранит время создания, по нему и ключу
+    строится ETag для ответов 304. Ответы помечаются Vary: Authorization
+    и Cache-Control: no-cache, чтобы браузер и прокси не отдали тело
+    анонимного ответа на запрос с токеном.
+    """
+    cache_namespaces = ()
+
+    def get_cache_timeout(self):
+        return settings.API_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return no_shared_reuse(view(request, *args, **kwargs))
+        versions = get_versions(self.cache_namespaces)
+        key = response_key(request, versions)
+        entry = cache.get(RESPONSE_KEY.format(key))
+        if entry is not None:
+            created, data = entry
+            headers = validators(key, created)
+            if self.not_modified(request, headers['ETag']):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED,
+                                    headers=headers)
+            else:
+                count('hits')
+                response = Response(data, headers={
+                    **headers, 'X-Cache': 'HIT'
+                })
+            return no_shared_reuse(response)
+        count('misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            created = time.time()
+            cache.set(
+                RESPONSE_KEY.format(key),
+                (created, response.data),
+                self.get_cache_timeout()
+            )
+            headers = {**validators(key, created), 'X-Cache': 'MISS'}
+            for header, value in headers.items():
+                response[header] = value
+        return no_shared_reuse(response)
+
+    @staticmethod
+    def not_modified(request, etag):
+        """Только по If-None-Match: Last-Modified точен лишь до секунды."""
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is None:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        return etag in tags or '*' in tags
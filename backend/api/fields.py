@@ -0,0 +1,24 @@
+from foodgram.images import ImageError, store_base64, store_upload
+from rest_framework import serializers
+
+
+class HashedImageField(serializers.ImageField):
+    """Картинка, сохраняемая под именем из хэша содержимого.
+
+    Принимает строку base64, как Base64ImageField, или загруженный файл.
+    Декодированная копия не держится в памяти, а Pillow проверяет только
+    заголовок и структуру файла, не декодируя картинку целиком.
+    """
+    default_error_messages = {
+        'invalid': 'Ожидается картинка в base64 или файлом.',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, str) and data:
+                return store_base64(data)
+            if hasattr(data, 'chunks'):
+                return store_upload(data)
+        except ImageError as error:
+            raise serializers.ValidationError(str(error))
+        self.fail('invalid')
@@ -1,5 +1,16 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
 from django_filters import rest_framework as filters
+from foodgram.indexes import ingredient_index, recipe_ingredient_index
 from foodgram.models import Ingredient, Recipe, Tag
+from foodgram.search import search_recipes
+from rest_framework.filters import OrderingFilter
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Список чисел через запятую."""
 
 
 class RecipeFilter(filters.FilterSet):
@@ -12,6 +23,9 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.NumberFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
+    has_ingredients = NumberInFilter(method='get_has_ingredients')
+    missing_max = filters.NumberFilter(method='get_missing_max')
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_anonymous:
@@ -31,17 +45,108 @@ class RecipeFilter(filters.FilterSet):
             return queryset.exclude(shoppinglist__user=self.request.user)
         return queryset.none()
 
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_has_ingredients(self, queryset, name, value):
+        """Рецепты из имеющихся ингредиентов, с долей покрытия.
+
+        missing_max - сколько ингредиентов рецепта может не хватать,
+        по умолчанию 0. Подбор идёт по инвертированному индексу, в запрос
+        попадают не больше RECIPE_INGREDIENT_SEARCH_LIMIT лучших рецептов.
+        """
+        missing_max = self.form.cleaned_data.get('missing_max') or 0
+        found = recipe_ingredient_index.match(
+            (int(ingredient_id) for ingredient_id in value),
+            max(int(missing_max), 0),
+            settings.RECIPE_INGREDIENT_SEARCH_LIMIT
+        )
+        groups = defaultdict(list)
+        for recipe_id, coverage, missing in found:
+            groups[coverage, missing].append(recipe_id)
+        return queryset.filter(
+            pk__in=[recipe_id for recipe_id, _, _ in found]
+        ).annotate(
+            ingredient_coverage=Case(
+                *(When(pk__in=ids, then=Value(coverage))
+                  for (coverage, _), ids in groups.items()),
+                output_field=FloatField()
+            ),
+            missing_ingredients=Case(
+                *(When(pk__in=ids, then=Value(missing))
+                  for (_, missing), ids in groups.items()),
+                output_field=IntegerField()
+            ),
+        )
+
+    def get_missing_max(self, queryset, name, value):
+        return queryset
+
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',)
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'has_ingredients', 'missing_max',
+        )
 
 
-class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith'
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов по счётчикам с устойчивым порядком по id.
+
+    popular и trending сортируют по заранее посчитанным оценкам
+    RecipeScore по возрастанию, как и остальные поля: самые популярные
+    рецепты первыми отдают -popular и -trending. При поиске без
+    явной сортировки рецепты упорядочены по релевантности, при подборе
+    по ингредиентам - по доле имеющихся ингредиентов.
+    """
+    rankings = {'popular': 'score__popular', 'trending': 'score__trending'}
+    relevance = (
+        ('search_rank', ['-search_rank', '-id']),
+        ('ingredient_coverage',
+         ['-ingredient_coverage', 'missing_ingredients', '-id']),
     )
 
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param):
+            for annotation, ordering in self.relevance:
+                if annotation in queryset.query.annotations:
+                    return ordering
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        if {'id', '-id'} & set(ordering):
+            return ordering
+        return [*ordering, '-id']
+
+    def filter_queryset(self, request, queryset, view):
+        fields = {
+            field.lstrip('-')
+            for field in self.get_ordering(request, queryset, view) or ()
+        } & self.rankings.keys()
+        if fields:
+            queryset = queryset.filter(score__isnull=False).annotate(**{
+                field: F(self.rankings[field]) for field in fields
+            })
+        return super().filter_queryset(request, queryset, view)
+
+
+class IngredientFilter(filters.FilterSet):
+    """Фильтрсет ингредиентов для автодополнения по индексу префиксов.
+
+    В запрос попадают не больше INGREDIENT_SEARCH_LIMIT лучших совпадений,
+    параметр limit применяет вьюха.
+    """
+    name = filters.CharFilter(method='get_name')
+
+    def get_name(self, queryset, name, value):
+        ids = ingredient_index.search(
+            value, settings.INGREDIENT_SEARCH_LIMIT
+        )
+        return queryset.filter(pk__in=ids).order_by(Case(
+            *(When(pk=pk, then=position) for position, pk in enumerate(ids)),
+            output_field=IntegerField()
+        ))
+
     class Meta:
         model = Ingredient
         fields = ['name', ]
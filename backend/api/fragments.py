@@ -0,0 +1,108 @@
+"""Готовые JSON-фрагменты карточек рецептов для списков.
+
+Почти всё в выдаче RecipeSerializer одинаково для всех читателей:
+название, картинки, текст, тэги и ингредиенты. Эта часть сериализуется
+один раз и хранится в кэше уже в виде JSON, версия пространства имён
+recipes меняется при сохранении рецепта, его ингредиентов и тэгов.
+К фрагменту дописываются автор, счётчики и флаги текущего пользователя,
+так что ответ собирается склейкой байтов без DRF-полей и рендерера.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from foodgram.memberships import get_state
+from foodgram.models import RecipeQuerySet
+
+from .cache import get_versions
+from .serializers import (CustomUserSerializer, RecipeFragmentSerializer,
+                          RecipeSerializer)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FRAGMENT_KEY = 'api_fragment:recipe:{}:{}:{}'
+
+
+def dumps(data):
+    """JSON в байтах, как у JSONRenderer: компактно и без \\u-экранов."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')
+    ).encode()
+
+
+def splice(head, tail):
+    """Склеивает два закодированных JSON-объекта в один."""
+    if head == b'{}':
+        return tail
+    if tail == b'{}':
+        return head
+    return head[:-1] + b',' + tail[1:]
+
+
+def get_fragments(request, recipes):
+    """Фрагменты рецептов из кэша, недостающие сериализуются заново."""
+    version = get_versions(('recipes',))[0]
+    base = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()
+    keys = {
+        recipe.pk: FRAGMENT_KEY.format(version, base, recipe.pk)
+        for recipe in recipes
+    }
+    fragments = cache.get_many(list(keys.values()))
+    missing = [
+        recipe for recipe in recipes if keys[recipe.pk] not in fragments
+    ]
+    if missing:
+        prefetch_related_objects(missing, *RecipeQuerySet.related_lookups())
+        serializer = RecipeFragmentSerializer(
+            missing, many=True, context={'request': request}
+        )
+        built = {
+            keys[item['id']]: dumps(item) for item in serializer.data
+        }
+        cache.set_many(built, settings.API_CACHE_TIMEOUT)
+        fragments.update(built)
+    return [fragments[keys[recipe.pk]] for recipe in recipes]
+
+
+def render_author(author, following):
+    return {
+        name: (
+            author.pk in following if name == 'is_subscribed'
+            else getattr(author, name)
+        )
+        for name in CustomUserSerializer.Meta.fields
+    }
+
+
+def render_recipes(request, recipes):
+    """JSON-массив карточек рецептов для текущего пользователя."""
+    state = get_state(request.user)
+    items = []
+    for recipe, fragment in zip(recipes, get_fragments(request, recipes)):
+        items.append(splice(fragment, dumps({
+            'author': render_author(recipe.author, state.following),
+            'is_favorited': recipe.pk in state.favorites,
+            'is_in_shopping_cart': recipe.pk in state.cart,
+            'favorites_count': recipe.favorites_count,
+            'cart_count': recipe.cart_count,
+            **RecipeSerializer.extra_data(recipe),
+        })))
+    return b'[' + b','.join(items) + b']'
+
+
+def render_page(request, recipes, envelope=None):
+    """Тело ответа: массив или страница пагинатора с results в конце."""
+    results = render_recipes(request, recipes)
+    if envelope is None:
+        return results
+    envelope = {
+        name: value for name, value in envelope.items() if name != 'results'
+    }
+    return splice(dumps(envelope), b'{"results":' + results + b'}')
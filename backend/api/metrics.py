@@ -0,0 +1,254 @@
+"""Метрики запросов к API в текстовом формате Prometheus.
+
+Метрики копятся в памяти процесса: каждый воркер отдаёт свои, а
+Prometheus суммирует их по экземплярам. Счётчики кэша ответов общие,
+они берутся из самого кэша.
+"""
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .authentication import token_cache
+from .cache import get_stats
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+METHODS = frozenset((
+    'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE',
+    'CONNECT'
+))
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def format_labels(names, values):
+    return ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', r'\\').replace('"', r'\"')
+        ) for name, value in zip(names, values)
+    )
+
+
+class CounterMetric:
+    """Счётчик с метками."""
+    kind = 'counter'
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def samples(self):
+        for values, total in sorted(self.series.items()):
+            yield self.name, format_labels(self.labels, values), total
+
+
+class HistogramMetric(CounterMetric):
+    """Гистограмма с накопительными корзинами, как в Prometheus."""
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels, buckets):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, values, value):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for values, (counts, total) in sorted(self.series.items()):
+            labels = format_labels(self.labels, values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket', f'{labels},le="{bound}"',
+                       cumulative)
+            yield f'{self.name}_sum', labels, round(total, 6)
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    """Набор метрик процесса, изменяется под общей блокировкой."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = CounterMetric(
+            'foodgram_http_requests_total',
+            'Запросы к API.',
+            ('view', 'method', 'status')
+        )
+        self.latency = HistogramMetric(
+            'foodgram_http_request_duration_seconds',
+            'Полное время обработки запроса.',
+            ('view',), LATENCY_BUCKETS
+        )
+        self.queries = HistogramMetric(
+            'foodgram_db_queries',
+            'SQL-запросов на запрос к API, по выборке.',
+            ('view',), QUERY_BUCKETS
+        )
+        self.db_time = HistogramMetric(
+            'foodgram_db_duration_seconds',
+            'Время в базе данных на запрос к API, по выборке.',
+            ('view',), LATENCY_BUCKETS
+        )
+        self.render_time = HistogramMetric(
+            'foodgram_render_duration_seconds',
+            'Время сериализации ответа в рендерере, по выборке.',
+            ('view',), LATENCY_BUCKETS
+        )
+        self.repeated_queries = CounterMetric(
+            'foodgram_repeated_queries_total',
+            'Запросы к API с повторяющимися SQL одной формы (N+1).',
+            ('view',)
+        )
+        self.reset_worker()
+
+    def reset_worker(self, threads=1):
+        """Начинает учёт загрузки заново, вызывается в новом воркере."""
+        self.threads = threads
+        self.started = time.monotonic()
+        self.busy = 0.0
+        self.in_flight = 0
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def leave(self, total):
+        with self.lock:
+            self.in_flight -= 1
+            self.busy += total
+
+    def metrics(self):
+        return (self.requests, self.latency, self.queries, self.db_time,
+                self.render_time, self.repeated_queries)
+
+    def record(self, view, method, status, total, recorder=None):
+        # Метод приходит от клиента: прочие не размножают метки.
+        if method not in METHODS:
+            method = 'other'
+        with self.lock:
+            self.requests.inc((view, method, status))
+            self.latency.observe((view,), total)
+            if recorder is None:
+                return
+            self.queries.observe((view,), recorder.count)
+            self.db_time.observe((view,), recorder.duration)
+            self.render_time.observe((view,), recorder.render_duration)
+            if recorder.repeated():
+                self.repeated_queries.inc((view,))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in self.metrics():
+                lines.append(f'# HELP {metric.name} {metric.description}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(
+                    f'{name}{{{labels}}} {value}'
+                    for name, labels, value in metric.samples()
+                )
+            lines.extend(self.render_worker())
+        stats = get_stats()
+        for event in ('hits', 'misses'):
+            name = f'foodgram_api_cache_{event}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {stats[event]}')
+        stats = token_cache.get_stats()
+        name = 'foodgram_token_cache_lookups_total'
+        lines.append(f'# HELP {name} Поиски токена в кэше аутентификации.')
+        lines.append(f'# TYPE {name} counter')
+        for result in ('local_hits', 'shared_hits', 'misses'):
+            lines.append(f'{name}{{result="{result}"}} {stats[result]}')
+        lines.append('# TYPE foodgram_token_cache_size gauge')
+        lines.append(f'foodgram_token_cache_size {stats["size"]}')
+        return '\n'.join(lines) + '\n'
+
+    def render_worker(self):
+        """Загрузка процесса: занятость потоков запросами с его старта."""
+        uptime = time.monotonic() - self.started
+        labels = f'pid="{os.getpid()}"'
+        for name, kind, description, value in (
+            ('foodgram_worker_busy_seconds_total', 'counter',
+             'Суммарное время обработки запросов потоками процесса.',
+             round(self.busy, 6)),
+            ('foodgram_worker_requests_in_flight', 'gauge',
+             'Запросы, которые процесс обрабатывает сейчас.',
+             self.in_flight),
+            ('foodgram_worker_threads', 'gauge',
+             'Потоков обработки запросов в процессе.', self.threads),
+            ('foodgram_worker_uptime_seconds', 'gauge',
+             'Время с запуска процесса.', round(uptime, 3)),
+            ('foodgram_worker_utilization', 'gauge',
+             'Доля времени потоков, занятая запросами, с запуска процесса.',
+             round(self.busy / (uptime * self.threads), 6) if uptime else 0),
+        ):
+            yield f'# HELP {name} {description}'
+            yield f'# TYPE {name} {kind}'
+            yield f'{name}{{{labels}}} {value}'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """Считает SQL-запросы, их время и формы через execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.render_started = None
+        self.render_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[IN_LIST.sub('IN (...)', sql)] += 1
+
+    def installed(self):
+        """Контекст, в котором запросы всех баз проходят через рекордер."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def start_render(self):
+        self.render_started = time.perf_counter()
+
+    def finish_render(self, response):
+        if self.render_started is not None:
+            self.render_duration = time.perf_counter() - self.render_started
+
+    def repeated(self):
+        """Формы SQL, повторившиеся не меньше METRICS_REPEATED_QUERIES раз."""
+        return [
+            (sql, count) for sql, count in self.shapes.most_common()
+            if count >= settings.METRICS_REPEATED_QUERIES
+        ]
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"',
+            f'render;dur={self.render_duration * 1000:.1f}',
+        )
@@ -0,0 +1,71 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from .metrics import QueryRecorder, registry
+
+logger = logging.getLogger('api.metrics')
+
+
+class MetricsMiddleware:
+    """Меряет запросы к API и отдаёт заголовок Server-Timing.
+
+    Для каждого запроса считается только полное время. Для доли
+    METRICS_SAMPLE_RATE запросов дополнительно считаются SQL-запросы,
+    время в базе и в рендерере, а повторяющиеся формы SQL попадают в лог
+    как вероятный N+1. При нулевой доле execute_wrapper не ставится вовсе.
+    Потоковые ответы меряются до начала отдачи тела. Время запросов
+    копится и в занятости процесса для метрик загрузки воркера.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        recorder = None
+        rate = settings.METRICS_SAMPLE_RATE
+        registry.enter()
+        try:
+            if rate and random.random() < rate:
+                recorder = request._metrics_recorder = QueryRecorder()
+                with recorder.installed():
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            registry.leave(total)
+        view = self.view_name(request)
+        registry.record(
+            view, request.method, response.status_code, total, recorder
+        )
+        timings = recorder.server_timing() if recorder else ()
+        response['Server-Timing'] = ', '.join(
+            (*timings, f'total;dur={total * 1000:.1f}')
+        )
+        if recorder is not None:
+            self.log_repeated(view, request, recorder)
+        return response
+
+    def process_template_response(self, request, response):
+        recorder = getattr(request, '_metrics_recorder', None)
+        if recorder is not None:
+            recorder.start_render()
+            response.add_post_render_callback(recorder.finish_render)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else 'unmatched'
+
+    @staticmethod
+    def log_repeated(view, request, recorder):
+        for sql, count in recorder.repeated():
+            logger.warning(
+                'Вероятный N+1 в %s %s (%s): запрос выполнен %d раз: %.300s',
+                request.method, request.path, view, count, sql
+            )
@@ -1,6 +1,29 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class MyPaginationClass(PageNumberPagination):
     """Кастомный класс пагинации."""
     page_size_query_param = 'limit'
+
+
+class MyCursorPaginationClass(CursorPagination):
+    """Курсорная пагинация по id: без COUNT(*) и OFFSET."""
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+
+class CursorPaginationMixin:
+    """Включает курсорную пагинацию по ?pagination=cursor.
+
+    Ссылки next/previous сохраняют параметр, так что клиент просто
+    переходит по ним. Без параметра остаётся постраничная пагинация.
+    """
+    cursor_pagination_class = MyCursorPaginationClass
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = self.cursor_pagination_class()
+        return super().paginator
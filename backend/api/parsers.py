@@ -0,0 +1,79 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils.datastructures import MultiValueDict
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import (DataAndFiles, FileUploadParser,
+                                    MultiPartParser)
+
+
+class ImageTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Картинка слишком большая.'
+    default_code = 'image_too_large'
+
+
+class ImageSizeLimitHandler(FileUploadHandler):
+    """Прерывает загрузку, как только файл превысил RECIPE_IMAGE_MAX_SIZE.
+
+    Стоит первым в цепочке и пропускает куски дальше, поэтому лишнее
+    не попадает ни в память, ни во временный файл.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        limit = (
+            settings.RECIPE_IMAGE_MAX_SIZE
+            + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        )
+        if content_length and content_length > limit:
+            raise ImageTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ImageTooLarge()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class ImageSizeLimitMixin:
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context['request'].upload_handlers.insert(
+            0, ImageSizeLimitHandler()
+        )
+        return super().parse(stream, media_type, parser_context)
+
+
+class MultiPartJSONParser(ImageSizeLimitMixin, MultiPartParser):
+    """multipart/form-data с JSON рецепта в поле data и файлами картинок.
+
+    Данные из data дополняются файлами и передаются сериализатору так же,
+    как тело JSON-запроса. Без поля data форма разбирается как обычно.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        if 'data' not in parsed.data:
+            return parsed
+        try:
+            data = json.loads(parsed.data['data'])
+        except ValueError as error:
+            raise ParseError(f'Поле data не является JSON: {error}')
+        if not isinstance(data, dict):
+            raise ParseError('Поле data должно быть объектом JSON.')
+        data.update(parsed.files.dict())
+        return DataAndFiles(data, MultiValueDict())
+
+
+class ImageUploadParser(ImageSizeLimitMixin, FileUploadParser):
+    """Тело запроса целиком - файл картинки, имя файла необязательно."""
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(
+            stream, media_type, parser_context
+        ) or 'image'
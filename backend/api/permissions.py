@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
@@ -19,3 +21,15 @@ class AuthorAdminOrReadOnly(BasePermission):
                 or request.user.is_admin
             )
         )
+
+
+class MetricsTokenOrAdmin(BasePermission):
+    """Доступ к метрикам по METRICS_TOKEN в заголовке Bearer или админу."""
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        if token and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+        ):
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,86 @@
+import abc
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку вместо её хранения."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRendererMixin(abc.ABC):
+    """Потоковый рендеринг списка покупок построчно."""
+    charset = 'utf-8'
+
+    @abc.abstractmethod
+    def stream(self, ingredients):
+        """Генератор фрагментов файла по строкам агрегата корзины."""
+
+    @staticmethod
+    def row(ingredient):
+        return (
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        )
+
+
+class TextShoppingCartRenderer(ShoppingCartRendererMixin, BaseRenderer):
+    """Список покупок в виде простого текста."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Сам список отдаётся потоком, сюда попадают только ошибки.
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, ingredients):
+        separator = ''
+        for ingredient in ingredients:
+            name, measurement_unit, amount = self.row(ingredient)
+            yield f'{separator}{name} - {amount} {measurement_unit}'
+            separator = '\n'
+
+
+class CSVShoppingCartRenderer(TextShoppingCartRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for ingredient in ingredients:
+            yield writer.writerow(self.row(ingredient))
+
+
+class JSONShoppingCartRenderer(ShoppingCartRendererMixin, JSONRenderer):
+    """Список покупок в формате JSON."""
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            name, measurement_unit, amount = self.row(ingredient)
+            yield separator + json.dumps({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            }, ensure_ascii=False)
+            separator = ',\n'
+        yield '[]' if separator == '[' else ']'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Текстовый формат Prometheus, ошибки отдаются строкой detail."""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = f"{data.get('detail', '')}\n"
+        return data.encode(self.charset)
@@ -0,0 +1,33 @@
+from foodgram import replicas
+from rest_framework import permissions, status
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы вьюсета читают с реплики базы.
+
+    Реплика выбирается после аутентификации, чтобы учесть закрепление
+    пользователя за основной базой. Успешная запись закрепляет автора
+    запроса, так что следующий его запрос увидит свои изменения.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS:
+            alias = replicas.choose(request.user)
+            if alias is not None:
+                self._replica_token = replicas.activate(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in permissions.SAFE_METHODS
+                and status.is_success(response.status_code)
+                and request.user.is_authenticated):
+            replicas.pin(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            token = self.__dict__.pop('_replica_token', None)
+            if token is not None:
+                replicas.deactivate(token)
@@ -1,11 +1,27 @@
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from foodgram.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                             ShoppingList, Tag)
+from foodgram import images
+from foodgram.indexes import recipe_ingredient_index
+from foodgram.memberships import get_state
+from foodgram.models import (FeedEntry, Ingredient, Recipe, RecipeIngredient,
+                             RecipeQuerySet, ShoppingCartIngredient,
+                             ShoppingList, Tag, increment)
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
-from users.models import Subscription, User
+from users.models import User
+
+from .cache import invalidate
+from .fields import HashedImageField
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 class CustomUserSerializer(UserSerializer):
@@ -19,8 +35,11 @@ class CustomUserSerializer(UserSerializer):
             'username',
             'first_name',
             'last_name',
-            'is_subscribed'
+            'is_subscribed',
+            'recipes_count',
+            'followers_count'
         )
+        read_only_fields = ('recipes_count', 'followers_count')
         model = User
 
     def get_is_subscribed(self, obj):
@@ -30,7 +49,9 @@ class CustomUserSerializer(UserSerializer):
             user = obj
         if not user.is_authenticated:
             return False
-        return Subscription.objects.filter(user=user, author=obj.id).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_state(user).following
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -118,7 +139,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         source='recipeingredient',
         required=True
     )
-    image = Base64ImageField(use_url=True, required=True)
+    image = HashedImageField(use_url=True, required=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -131,110 +153,253 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
-            'cooking_time'
+            'cooking_time',
+            'favorites_count',
+            'cart_count'
         )
+        read_only_fields = ('favorites_count', 'cart_count')
 
     def to_representation(self, instance):
-        data = super(RecipeSerializer, self).to_representation(instance)
-        data['tags'] = TagSerializer(instance.tags.all(), many=True).data
-        data['ingredients'] = RecipeIngredientSerializer(
-            instance.recipeingredient.all(), many=True).data
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if 'recipeingredient' not in prefetched:
+            prefetch_related_objects(
+                [instance], *RecipeQuerySet.related_lookups()
+            )
+        data = super().to_representation(instance)
+        data.update(self.extra_data(instance))
+        return data
+
+    @staticmethod
+    def extra_data(instance):
+        """Поля подбора по ингредиентам и поиска, если они посчитаны."""
+        data = {}
+        if hasattr(instance, 'ingredient_coverage'):
+            data['ingredient_coverage'] = instance.ingredient_coverage
+            data['missing_ingredients'] = instance.missing_ingredients
+        if hasattr(instance, 'search_rank'):
+            data['search_rank'] = instance.search_rank
+            data['search_snippet'] = getattr(instance, 'search_snippet', None)
         return data
 
+    def get_image_variants(self, obj):
+        """Ссылки на уменьшенные копии, пока их нет - None."""
+        if not obj.image_processed:
+            return None
+        request = self.context.get('request')
+
+        def url(name):
+            url = obj.image.storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+        return {
+            variant: {fmt: url(name) for fmt, name in formats.items()}
+            for variant, formats in images.variant_names(
+                obj.image.name
+            ).items()
+        }
+
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        return Favorite.objects.filter(
-            recipe=obj,
-            user=request.user
-        ).exists()
+        return obj.pk in get_state(request.user).favorites
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        return ShoppingList.objects.filter(
-            recipe=obj,
-            user=request.user
-        ).exists()
+        return obj.pk in get_state(request.user).cart
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
+        amounts = [
+            item['amount'] for item in data.pop('recipeingredient', ())
+        ]
+        data['ingredients'] = self.validate_ingredient_items(
+            self.initial_data.get('ingredients'), amounts
+        )
+        data['tags'] = self.validate_tag_items(self.initial_data.get('tags'))
+        cooking_time = data.get('cooking_time')
+        if cooking_time is None or cooking_time <= 0:
+            raise serializers.ValidationError({
+                'cooking_time': 'Время приготовление должно быть больше нуля!'
+            })
+        return data
+
+    def validate_ingredient_items(self, ingredients, amounts):
+        """Проверяет ингредиенты рецепта одним запросом к базе."""
         if not ingredients:
             raise serializers.ValidationError(
                 'Необходимо добавить хотя бы 1 игредиент!'
             )
-
-        ingredient_list = []
-        for ingredient_item in ingredients:
-            ingredient_id = ingredient_item.get('id')
-            ingredient = get_object_or_404(Ingredient,
-                                           id=ingredient_id)
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError('Ингридиенты должны '
-                                                  'быть уникальными!')
-            ingredient_list.append(ingredient)
-
-            amount = ingredient_item.get('amount')
-            if int(amount) <= 0:
-                raise serializers.ValidationError('Проверьте, что количество'
-                                                  'ингредиента больше нуля!')
-
-        tags = self.initial_data.get('tags')
+        found = Ingredient.objects.in_bulk(
+            {to_int(item.get('id')) for item in ingredients} - {None}
+        )
+        items = []
+        errors = []
+        seen = set()
+        for item, amount in zip(ingredients, amounts):
+            ingredient = found.get(to_int(item.get('id')))
+            item_errors = {}
+            if ingredient is None:
+                item_errors['id'] = ['Ингредиент не найден.']
+            elif ingredient.pk in seen:
+                item_errors['id'] = ['Ингридиенты должны быть уникальными!']
+            else:
+                seen.add(ingredient.pk)
+            if amount <= 0:
+                item_errors['amount'] = [
+                    'Проверьте, что количество ингредиента больше нуля!'
+                ]
+            errors.append(item_errors)
+            items.append({'ingredient': ingredient, 'amount': amount})
+        if any(errors):
+            raise serializers.ValidationError({'ingredients': errors})
+        return items
+
+    def validate_tag_items(self, tags):
+        """Проверяет тэги рецепта одним запросом к базе."""
         if not tags:
             raise serializers.ValidationError({
                 'tags': 'Нужно выбрать хотя бы один тэг!'
             })
-
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError({
-                    'tags': 'Тэги должны быть уникальными!'
-                })
-            tags_list.append(tag)
-
-        cooking_time = data.get('cooking_time')
-        if int(cooking_time) <= 0:
-            raise serializers.ValidationError({
-                'cooking_time': 'Время приготовление должно быть больше нуля!'
-            })
-
-        data['ingredients'] = ingredients
-        data['tags'] = tags
-        return data
+        found = Tag.objects.in_bulk({to_int(tag) for tag in tags} - {None})
+        errors = {}
+        seen = set()
+        for index, tag_id in enumerate(map(to_int, tags)):
+            if tag_id not in found:
+                errors[index] = ['Тэг не найден.']
+            elif tag_id in seen:
+                errors[index] = ['Тэги должны быть уникальными!']
+            seen.add(tag_id)
+        if errors:
+            raise serializers.ValidationError({'tags': errors})
+        return [found[tag_id] for tag_id in seen]
 
     def ingredients_creation(self, ingredients, recipe):
         RecipeIngredient.objects.bulk_create(
-            (RecipeIngredient(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+            RecipeIngredient(
+                ingredient=item['ingredient'],
                 recipe=recipe,
-                amount=ingredient['amount']
-            ) for ingredient in ingredients)
+                amount=item['amount']
+            ) for item in ingredients
         )
+        if ingredients:
+            recipe_ingredient_index.changed((recipe.pk,))
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        validated_data.pop('recipeingredient')
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags_data)
         self.ingredients_creation(ingredients_data, recipe)
+        increment(User.objects.filter(pk=author.pk), 'recipes_count')
+        author.refresh_from_db(fields=('recipes_count',))
+        FeedEntry.objects.fan_out(recipe)
+        images.schedule(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        instance.tags.clear()
-        RecipeIngredient.objects.filter(recipe=instance).all().delete()
-        tags_data = validated_data.pop('tags')
-        instance.tags.set(tags_data)
-        ingredients = validated_data.pop('ingredients')
-        validated_data.pop('recipeingredient')
-        self.ingredients_creation(ingredients, instance)
-        return super().update(instance, validated_data)
+        self.update_tags(instance, validated_data.pop('tags'))
+        self.update_ingredients(instance, validated_data.pop('ingredients'))
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if 'image' in changed_fields:
+            instance.image_processed = False
+            changed_fields.append('image_processed')
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        if 'image' in changed_fields:
+            images.schedule(instance)
+        return instance
+
+    def update_tags(self, recipe, tags):
+        if {tag.pk for tag in recipe.tags.all()} != {tag.pk for tag in tags}:
+            recipe.tags.set(tags)
+
+    def update_ingredients(self, recipe, ingredients):
+        """Вносит в состав рецепта только изменившиеся ингредиенты."""
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipeingredient.all()
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        new_amounts = {
+            item['ingredient'].pk: item['amount'] for item in ingredients
+        }
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = new_amounts.get(ingredient_id, recipe_ingredient.amount)
+            if amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = [
+            item for item in ingredients
+            if item['ingredient'].pk not in current
+        ]
+        self.ingredients_creation(added, recipe)
+        if changed or added:
+            invalidate('recipes')
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe, old_amounts, new_amounts
+        )
+
+
+class RecipeFragmentSerializer(RecipeSerializer):
+    """Часть рецепта, одинаковая для всех читателей."""
+
+    class Meta(RecipeSerializer.Meta):
+        fields = (
+            'id',
+            'tags',
+            'ingredients',
+            'name',
+            'image',
+            'image_variants',
+            'text',
+            'cooking_time',
+        )
+
+    @staticmethod
+    def extra_data(instance):
+        return {}
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Сериализатор замены картинки рецепта."""
+    image = HashedImageField(use_url=True, required=True)
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def update(self, instance, validated_data):
+        image = validated_data['image']
+        if instance.image == image:
+            return instance
+        instance.image = image
+        instance.image_processed = False
+        instance.save(update_fields=['image', 'image_processed'])
+        images.schedule(instance)
+        return instance
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -243,25 +408,6 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time',)
 
-    def validate(self, data):
-        request = self.context.get('request')
-        current_user = request.user
-        recipe_in_favorite = Favorite.objects.filter(
-            user=current_user,
-            recipe=self.initial_data['recipe']
-        )
-        if request.method == 'POST':
-            if recipe_in_favorite.exists():
-                raise serializers.ValidationError({
-                    'errors': 'Этот рецепт уже есть в избранном.'
-                })
-        if request.method == 'DELETE':
-            if not recipe_in_favorite.exists():
-                raise serializers.ValidationError({
-                    'errors': 'Этого рецепта нет в избранном.'
-                })
-        return data
-
 
 class ShoppingListSerializer(serializers.ModelSerializer):
     """Сериализатор модели корзины."""
@@ -288,31 +434,19 @@ class ShoppingListSerializer(serializers.ModelSerializer):
     def get_cooking_time(self, obj):
         return obj.cooking_time
 
-    def validate(self, data):
-        request = self.context.get('request')
-        current_user = request.user
-        recipe_in_shopping_list = ShoppingList.objects.filter(
-            user=current_user,
-            recipe=self.initial_data['recipe']
-        )
-        if request.method == 'POST':
-            if recipe_in_shopping_list.exists():
-                raise serializers.ValidationError({
-                    'errors': 'Этот рецепт уже есть в списке покупок.'
-                })
-        if request.method == 'DELETE':
-            if not recipe_in_shopping_list.exists():
-                raise serializers.ValidationError({
-                    'errors':
-                    'Этого рецепта нет в списке покупок пользователя.'
-                })
-        return data
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT
+    )
 
 
 class UserSubscriptionSerializer(CustomUserSerializer):
     """Сериализатор подписки пользователя."""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
     is_subscribed = serializers.BooleanField(read_only=True, default=True)
 
     class Meta:
@@ -325,41 +459,19 @@ class UserSubscriptionSerializer(CustomUserSerializer):
             'last_name',
             'is_subscribed',
             'recipes',
-            'recipes_count'
+            'recipes_count',
+            'followers_count'
         )
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        read_only_fields = ('recipes_count', 'followers_count')
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes
-        if limit:
-            recipes = recipes.all()[:int(limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            limit = to_int(request.GET.get('recipes_limit'))
+            recipes = obj.recipes
+            if limit is not None:
+                recipes = recipes.all()[:max(limit, 0)]
         context = {'request': request}
         return ShoppingListSerializer(recipes, context=context, many=True).data
-
-    def validate(self, data):
-        request = self.context.get('request')
-        current_user = request.user
-        author = self.initial_data['author']
-        in_subscribed = Subscription.objects.filter(
-            user=current_user,
-            author=author
-        )
-        if request.method == 'POST':
-            if in_subscribed.exists():
-                raise serializers.ValidationError({
-                    'errors': 'Вы уже подписаны на этого автора.'
-                })
-            if author == current_user:
-                raise serializers.ValidationError({
-                    'errors': 'Нельзя подписаться на себя.'
-                })
-        if request.method == 'DELETE':
-            if not in_subscribed.exists():
-                raise serializers.ValidationError({
-                    'errors': 'Вы не подписаны на этого автора.'
-                })
-        return data
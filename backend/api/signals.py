@@ -0,0 +1,46 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from foodgram.models import Ingredient, Recipe, RecipeIngredient, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import token_cache
+from .cache import invalidate
+
+USER_SERVICE_FIELDS = {'last_login', 'password'}
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes(**kwargs):
+    invalidate('recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    invalidate('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    invalidate('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_authors(update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= USER_SERVICE_FIELDS:
+        return
+    invalidate('recipes')
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    token_cache.discard([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    token_cache.discard_user(instance.pk)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (CacheStatsView, IngredientViewSet, MetricsView,
+                    RecipeViewSet, TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -14,6 +15,8 @@ router.register('users', UserViewSet, basename='users')
 urlpatterns = [
     path('users/subscriptions/',
          UserViewSet.as_view({'get': 'subscriptions', })),
+    path('cache/stats/', CacheStatsView.as_view()),
+    path('metrics/', MetricsView.as_view()),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
     path('', include(router.urls)),
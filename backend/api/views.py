@@ -1,47 +1,248 @@
 from api.serializers import (FavoriteSerializer, IngredientSerializer,
+                             RecipeIdsSerializer, RecipeImageSerializer,
                              RecipeSerializer, ShoppingListSerializer,
-                             TagSerializer, UserSubscriptionSerializer)
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
-from foodgram.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                             ShoppingList, Tag)
+                             TagSerializer, UserSubscriptionSerializer, to_int)
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django_filters.rest_framework import DjangoFilterBackend
+from foodgram import memberships
+from foodgram.models import (FeedEntry, Ingredient, Recipe,
+                             ShoppingCartIngredient, Tag, increment,
+                             recipe_amounts)
+from foodgram.search import attach_snippets
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from users.models import Subscription, User
+from rest_framework.views import APIView
+from users.models import User
 
-from .filters import IngredientFilter, RecipeFilter
-from .permissions import AuthorAdminOrReadOnly
+from . import fragments
+from .cache import AnonymousCacheMixin, get_stats
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .metrics import registry
+from .paginators import CursorPaginationMixin
+from .parsers import ImageUploadParser, MultiPartJSONParser
+from .permissions import AuthorAdminOrReadOnly, MetricsTokenOrAdmin
+from .renderers import (CSVShoppingCartRenderer, JSONShoppingCartRenderer,
+                        PrometheusRenderer, TextShoppingCartRenderer)
+from .replicas import ReplicaReadMixin
 
+SHOPPING_CART_CHUNK_SIZE = 2000
 
-class TagViewSet(viewsets.ModelViewSet):
+FAVORITE_ERRORS = {
+    'POST': 'Этот рецепт уже есть в избранном.',
+    'DELETE': 'Этого рецепта нет в избранном.',
+}
+CART_ERRORS = {
+    'POST': 'Этот рецепт уже есть в списке покупок.',
+    'DELETE': 'Этого рецепта нет в списке покупок пользователя.',
+}
+SUBSCRIPTION_ERRORS = {
+    'POST': 'Вы уже подписаны на этого автора.',
+    'DELETE': 'Вы не подписаны на этого автора.',
+}
+
+
+def add_to_cart(user, recipes):
+    ShoppingCartIngredient.objects.add_recipes(
+        user, [recipe.pk for recipe in recipes]
+    )
+
+
+def remove_from_cart(user, recipe_ids):
+    ShoppingCartIngredient.objects.remove_recipes(user, recipe_ids)
+
+
+def backfill_feed(user, authors):
+    for author in authors:
+        FeedEntry.objects.backfill(user, author)
+
+
+def remove_from_feed(user, author_ids):
+    for author_id in author_ids:
+        FeedEntry.objects.remove_author(user, author_id)
+
+
+def change_memberships(request, membership, target_ids, on_add=None,
+                       on_remove=None):
+    """Добавляет (POST) или убирает связи, возвращает изменённое.
+
+    Для POST это объекты целей со свежими счётчиками, для DELETE - id.
+    Обработчик изменений выполняется в той же транзакции. Закэшированные
+    анонимные ответы со счётчиками не сбрасываются: они живут не дольше
+    API_COUNTERS_CACHE_TIMEOUT.
+    """
+    with transaction.atomic():
+        if request.method == 'POST':
+            changed = memberships.add(membership, request.user, target_ids)
+            callback = on_add
+        else:
+            changed = memberships.remove(
+                membership, request.user, target_ids
+            )
+            callback = on_remove
+        if changed and callback is not None:
+            callback(request.user, changed)
+    return changed
+
+
+def toggle_membership(request, membership, pk, serializer_class, errors,
+                      **callbacks):
+    """Одна связь; цель ищется отдельно, только если ничего не изменилось."""
+    target_id = to_int(pk)
+    if target_id is None:
+        raise Http404
+    changed = change_memberships(request, membership, [target_id], **callbacks)
+    if changed and request.method == 'POST':
+        serializer = serializer_class(changed[0], context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    if changed:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    if not membership.target_model.objects.filter(pk=target_id).exists():
+        raise Http404
+    return Response(
+        {'errors': errors[request.method]},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def bulk_membership(request, membership, serializer_class, **callbacks):
+    """Много рецептов за запрос; отсутствующие и уже учтённые пропускаются."""
+    serializer = RecipeIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    changed = change_memberships(
+        request, membership, serializer.validated_data['recipes'],
+        **callbacks
+    )
+    if request.method == 'POST':
+        serializer = serializer_class(
+            changed, many=True, context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response({'removed': changed})
+
+
+class TagViewSet(ReplicaReadMixin, AnonymousCacheMixin,
+                 viewsets.ModelViewSet):
     """Вьюсет для тэгов."""
+    cache_namespaces = ('tags',)
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, AnonymousCacheMixin,
+                        viewsets.ModelViewSet):
     """Вьюсет для ингредиентов."""
+    cache_namespaces = ('ingredients',)
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
     filterset_class = IngredientFilter
     filterset_fields = ('name',)
 
+    def filter_queryset(self, queryset):
+        """Не больше limit ингредиентов в списке, после всех фильтров."""
+        queryset = super().filter_queryset(queryset)
+        limit = to_int(self.request.query_params.get('limit'))
+        if self.action != 'list' or limit is None or limit <= 0:
+            return queryset
+        return queryset[:limit]
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, AnonymousCacheMixin,
+                    CursorPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
+    cache_namespaces = ('recipes',)
     serializer_class = RecipeSerializer
     queryset = Recipe.objects.all()
     permission_classes = [AuthorAdminOrReadOnly, ]
+    parser_classes = (JSONParser, MultiPartJSONParser)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
     filterset_fields = (
         'tags',
         'author',
         'is_favorited',
-        'is_in_shopping_cart'
+        'is_in_shopping_cart',
+        'search',
+        'has_ingredients',
+        'missing_max'
+    )
+    ordering_fields = (
+        'id', 'favorites_count', 'cart_count', 'popular', 'trending'
     )
+    ordering = ('-id',)
+
+    def get_cache_timeout(self):
+        return min(settings.API_CACHE_TIMEOUT,
+                   settings.API_COUNTERS_CACHE_TIMEOUT)
+
+    def get_queryset(self):
+        return Recipe.objects.with_related().select_related('author')
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fragments(request):
+            return super().list(request, *args, **kwargs)
+        return self.fragment_list(self.filter_queryset(self.get_queryset()))
+
+    def use_fragments(self, request):
+        return (
+            settings.RECIPE_FRAGMENTS
+            and request.user.is_authenticated
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def fragment_list(self, queryset):
+        """Список из готовых JSON-фрагментов, в обход сериализатора."""
+        queryset = queryset.prefetch_related(None)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            body = fragments.render_page(self.request, list(queryset))
+        else:
+            body = fragments.render_page(
+                self.request, page, self.get_paginated_response([]).data
+            )
+        return HttpResponse(body, content_type='application/json')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        query = self.request.query_params.get('search', '').strip()
+        if page is not None and query:
+            attach_snippets(page, query, queryset.db)
+        return page
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingCartIngredient.objects.change_recipe(
+            instance, recipe_amounts(instance), {}
+        )
+        increment(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+        )
+        instance.delete()
+
+    @action(
+        detail=True,
+        methods=['PUT'],
+        url_path='image',
+        parser_classes=(ImageUploadParser,))
+    def image(self, request, pk):
+        """Заменяет картинку рецепта телом запроса, без base64."""
+        recipe = self.get_object()
+        serializer = RecipeImageSerializer(
+            recipe,
+            data={'image': request.data.get('file')},
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            RecipeSerializer(recipe, context={'request': request}).data
+        )
 
     @action(
         detail=True,
@@ -49,28 +250,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='favorite',
         permission_classes=(permissions.IsAuthenticated,))
     def favorite(self, request, pk):
-        current_user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        recipe_in_favorite = Favorite.objects.filter(
-            user=current_user,
-            recipe=recipe
+        return toggle_membership(
+            request, memberships.FAVORITES, pk, FavoriteSerializer,
+            FAVORITE_ERRORS
         )
-        data = {'user': current_user, 'recipe': recipe}
-        serializer = FavoriteSerializer(
-            data=data,
-            context={'request': request},
-            partial=True
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='favorite/bulk',
+        permission_classes=(permissions.IsAuthenticated,))
+    def favorite_bulk(self, request):
+        return bulk_membership(
+            request, memberships.FAVORITES, FavoriteSerializer
         )
-        serializer.is_valid(raise_exception=True)
-        if request.method == 'POST':
-            Favorite.objects.create(user=current_user, recipe=recipe)
-            serializer = FavoriteSerializer(
-                recipe,
-                context={'request': request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        recipe_in_favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -79,48 +272,69 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def shopping_cart(self, request, pk):
-        current_user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        in_shopping_cart = ShoppingList.objects.filter(
-            user=current_user, recipe=recipe)
-        data = {'user': current_user, 'recipe': recipe}
-        serializer = ShoppingListSerializer(
-            data=data,
-            context={'request': request},
-            partial=True
+        return toggle_membership(
+            request, memberships.CART, pk, ShoppingListSerializer,
+            CART_ERRORS, on_add=add_to_cart, on_remove=remove_from_cart
+        )
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        url_path='shopping_cart/bulk',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        return bulk_membership(
+            request, memberships.CART, ShoppingListSerializer,
+            on_add=add_to_cart, on_remove=remove_from_cart
         )
-        serializer.is_valid(raise_exception=True)
-        if request.method == 'POST':
-            ShoppingList.objects.create(user=current_user, recipe=recipe)
-            serializer = ShoppingListSerializer(
-                recipe,
-                context={'request': request}
-            )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        in_shopping_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
         methods=['GET'],
-        url_path='download_shopping_cart',
+        url_path='feed',
         permission_classes=(permissions.IsAuthenticated,)
     )
+    def feed(self, request):
+        recipes = self.filter_queryset(
+            self.get_queryset().feed(request.user)
+        )
+        if self.use_fragments(request):
+            return self.fragment_list(recipes)
+        page = self.paginate_queryset(recipes)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='download_shopping_cart',
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(
+            TextShoppingCartRenderer,
+            CSVShoppingCartRenderer,
+            JSONShoppingCartRenderer,
+        )
+    )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shoppinglist__user=request.user)
-        ingrediants_values = ingredients.values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
-        shopping_cart = '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["amount"]} '
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingrediants_values
-        ])
-        return HttpResponse(shopping_cart, content_type='text/plain')
-
-
-class UserViewSet(viewsets.ModelViewSet):
+        ingredients_values = ShoppingCartIngredient.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
+        renderer = request.accepted_renderer
+        rows = ingredients_values.iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
+
+
+class UserViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет для пользователя."""
     serializer_class = UserSubscriptionSerializer
     queryset = User.objects.all()
@@ -131,26 +345,16 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def subscribe(self, request, pk):
-        current_user = self.request.user
-        author = get_object_or_404(User, pk=pk)
-        in_subscribed = Subscription.objects.filter(
-            user=current_user, author=author)
-        data = {'user': current_user, 'author': author}
-        serializer = UserSubscriptionSerializer(
-            data=data,
-            context={'request': request},
-            partial=True
-        )
-        serializer.is_valid(raise_exception=True)
-        if request.method == 'POST':
-            Subscription.objects.create(user=current_user, author=author)
-            serializer = UserSubscriptionSerializer(
-                author,
-                context={'request': request}
+        if request.method == 'POST' and to_int(pk) == request.user.pk:
+            return Response(
+                {'errors': 'Нельзя подписаться на себя.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        in_subscribed.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return toggle_membership(
+            request, memberships.SUBSCRIPTIONS, pk,
+            UserSubscriptionSerializer, SUBSCRIPTION_ERRORS,
+            on_add=backfill_feed, on_remove=remove_from_feed
+        )
 
     @action(
         detail=False,
@@ -160,8 +364,37 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscriptions(self, request):
         current_user = request.user
-        user_subscribtions = User.objects.filter(subscribed__user=current_user)
+        recipes = Recipe.objects.all()
+        limit = to_int(request.query_params.get('recipes_limit'))
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).values('id')[:max(limit, 0)]
+            ))
+        user_subscribtions = User.objects.filter(
+            subscribed__user=current_user
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('-id')
         subscriptions_paginated = self.paginate_queryset(user_subscribtions)
         serializer = UserSubscriptionSerializer(
             subscriptions_paginated, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
+
+
+class CacheStatsView(APIView):
+    """Счётчики попаданий в кэш ответов для анонимных пользователей."""
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class MetricsView(APIView):
+    """Метрики запросов к API и кэша в формате Prometheus."""
+    permission_classes = (MetricsTokenOrAdmin,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(registry.render())
@@ -0,0 +1,51 @@
+"""Прогрев процесса до первых запросов.
+
+warm_imports выполняется в мастере gunicorn при preload: импорт URLconf
+тянет за собой вьюхи, сериализаторы, фильтры и админку, и воркеры
+получают эти модули при fork готовыми, в общих страницах памяти.
+warm_worker выполняется в каждом воркере после загрузки приложения и
+заполняет то, что живёт в памяти процесса и читает базу.
+"""
+import logging
+
+from django.db import DatabaseError, connections
+from django.urls import resolve, reverse
+from foodgram.indexes import ingredient_index, recipe_ingredient_index
+
+from .metrics import registry
+
+logger = logging.getLogger('api.warmup')
+
+
+def warm_imports():
+    """URLconf со всеми вьюхами и заполненный распознаватель URL."""
+    resolve('/api/recipes/')
+    reverse('api:recipes-list')
+
+
+def warm_caches():
+    """Индексы ингредиентов.
+
+    Ответы API не прогреваются: адрес сайта входит в ключ кэша, и
+    ответ, собранный без настоящего запроса, никому бы не подошёл.
+    """
+    ingredient_index.ensure_loaded()
+    recipe_ingredient_index.ensure_loaded()
+
+
+def warm_worker(threads):
+    """Прогрев воркера, после него соединения с базой закрываются.
+
+    Прогрев идёт в главном потоке воркера, а запросы обрабатывают
+    другие потоки, так что открытое здесь соединение только бы висело.
+    Недоступная или ещё не мигрированная база не мешает воркеру
+    запуститься: индексы тогда загрузятся первыми запросами.
+    """
+    registry.reset_worker(threads)
+    warm_imports()
+    try:
+        warm_caches()
+    except DatabaseError as error:
+        logger.warning('Прогрев кэшей пропущен: %s', error)
+    finally:
+        connections.close_all()
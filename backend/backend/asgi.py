@@ -0,0 +1,17 @@
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def get_asgi_application():
+    """Django в пуле потоков, перед ним быстрый путь для кэша ответов."""
+    django_application = get_wsgi_application()
+    from api.asgi import CachedResponseApplication, ThreadPoolApplication
+    return CachedResponseApplication(
+        ThreadPoolApplication(django_application)
+    )
+
+
+application = get_asgi_application()
@@ -0,0 +1,173 @@
+"""PostgreSQL с пулом соединений внутри процесса.
+
+Подключается как ENGINE = 'backend.db.postgresql'. Закрытие соединения
+в Django возвращает его в пул, а новое соединение берётся из пула, так
+что при CONN_MAX_AGE = 0 поток держит соединение только на время
+запроса, и потоков в процессе может быть больше, чем соединений.
+Параметры пула задаются в DATABASES[...]['POOL']:
+    SIZE - наибольшее число соединений одного процесса;
+    TIMEOUT - сколько секунд ждать свободного соединения;
+    RECYCLE - через сколько секунд соединение закрывается и открывается
+        заново;
+    CHECK_INTERVAL - после скольких секунд простоя соединение перед
+        выдачей проверяется запросом SELECT 1.
+"""
+import os
+import threading
+import time
+from functools import partial
+
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+POOL_DEFAULTS = {
+    'SIZE': 10,
+    'TIMEOUT': 10,
+    'RECYCLE': 1800,
+    'CHECK_INTERVAL': 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений psycopg2 одного процесса."""
+
+    def __init__(self, size, timeout, recycle, check_interval):
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check_interval = check_interval
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.created = {}
+
+    def acquire(self, connect):
+        """Свободное исправное соединение из пула или новое."""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                f'Нет свободного соединения в пуле за {self.timeout} с.'
+            )
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, released = self.idle.pop()
+                if self.usable(connection, released):
+                    return connection
+                self.discard(connection)
+            connection = connect()
+            with self.lock:
+                self.created[connection] = time.monotonic()
+            return connection
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection):
+        """Возвращает соединение в пул, сломанное или старое закрывает."""
+        try:
+            if self.reset(connection):
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+            else:
+                self.discard(connection)
+        finally:
+            self.slots.release()
+
+    def expired(self, connection):
+        return time.monotonic() - self.created[connection] > self.recycle
+
+    def usable(self, connection, released):
+        if connection.closed or self.expired(connection):
+            return False
+        if time.monotonic() - released < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def reset(self, connection):
+        """Откатывает незавершённую транзакцию, как при закрытии."""
+        if connection.closed or self.expired(connection):
+            return False
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            connection.autocommit = True
+        except base.Database.Error:
+            return False
+        return True
+
+    def discard(self, connection):
+        with self.lock:
+            self.created.pop(connection, None)
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+
+    def clear(self):
+        """Закрывает простаивающие соединения."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self.discard(connection)
+
+
+def get_pool(alias, conn_params, options):
+    """Пул процесса для базы; после fork воркера создаётся новый."""
+    key = (os.getpid(), alias, tuple(sorted(conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {**POOL_DEFAULTS, **options}
+            pool = _pools[key] = ConnectionPool(
+                options['SIZE'], options['TIMEOUT'], options['RECYCLE'],
+                options['CHECK_INTERVAL']
+            )
+        return pool
+
+
+def clear_pools(database):
+    """Закрывает простаивающие соединения процесса с базой database."""
+    with _pools_lock:
+        pools = [
+            pool for (pid, _, params), pool in _pools.items()
+            if pid == os.getpid() and dict(params).get('database') == database
+        ]
+    for pool in pools:
+        pool.clear()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        clear_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get('POOL', {})
+        )
+        connection = self.pool.acquire(
+            partial(super().get_new_connection, conn_params)
+        )
+        self.isolation_level = connection.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.release(self.connection)
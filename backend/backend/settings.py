@@ -1,3 +1,4 @@
+import itertools
 import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,10 +67,123 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE', default=10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'RECYCLE': int(os.getenv('DB_POOL_RECYCLE', default=1800)),
+            'CHECK_INTERVAL': int(os.getenv('DB_POOL_CHECK_INTERVAL', default=30)),
+        },
+    }
+}
+
+if DATABASES['default']['ENGINE'] == 'backend.db.postgresql':
+    # Пул сам держит соединения, поток возвращает своё в конце запроса.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+DATABASE_REPLICAS = []
+for number, (host, name) in enumerate(itertools.zip_longest(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(',')),
+    filter(None, os.getenv('DB_REPLICA_NAMES', default='').split(','))
+), start=1):
+    host, _, port = (host or '').partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+
+DB_REPLICA_PIN_TIMEOUT = int(os.getenv('DB_REPLICA_PIN_TIMEOUT', default=10))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
 
+CACHE_SHARED = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default=300))
+
+API_COUNTERS_CACHE_TIMEOUT = int(
+    os.getenv('API_COUNTERS_CACHE_TIMEOUT', default=30)
+)
+
+INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', default=300))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=100))
+
+FEED_POPULAR_AUTHORS_TIMEOUT = int(
+    os.getenv('FEED_POPULAR_AUTHORS_TIMEOUT', default=60)
+)
+
+RECIPE_SCORE_POPULAR_HALF_LIFE = float(
+    os.getenv('RECIPE_SCORE_POPULAR_HALF_LIFE', default=30)
+)
+
+RECIPE_SCORE_TRENDING_HALF_LIFE = float(
+    os.getenv('RECIPE_SCORE_TRENDING_HALF_LIFE', default=2)
+)
+
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=100)
+)
+
+RECIPE_INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('RECIPE_INGREDIENT_SEARCH_LIMIT', default=1000)
+)
+
+RECIPE_SCORE_CART_WEIGHT = float(
+    os.getenv('RECIPE_SCORE_CART_WEIGHT', default=0.5)
+)
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024)
+)
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', default=100))
+
+RECIPE_FRAGMENTS = os.getenv('RECIPE_FRAGMENTS', default='1') == '1'
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', default=8))
+
+MEMBERSHIP_CACHE_TIMEOUT = int(
+    os.getenv('MEMBERSHIP_CACHE_TIMEOUT', default=600)
+)
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', default=0))
+
+METRICS_REPEATED_QUERIES = int(
+    os.getenv('METRICS_REPEATED_QUERIES', default=5)
+)
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='1') == '1'
+
+TOKEN_CACHE_LOCAL = os.getenv('TOKEN_CACHE_LOCAL', default='0') == '1'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -111,7 +226,7 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
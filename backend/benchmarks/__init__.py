@@ -0,0 +1,17 @@
+"""Бенчмарки бэкенда на синтетических данных.
+
+Сценарии запускаются из каталога backend:
+    python -m benchmarks.<сценарий> --help
+Каждый сценарий создаёт временную тестовую базу и удаляет её по завершении.
+
+Сценарий api прогоняет все маршруты API и пишет результат в JSON, чтобы
+сравнивать коммиты между собой:
+    python -m benchmarks.api --http --output before.json
+    python -m benchmarks.api --http --compare before.json
+
+Сценарий deployment сравнивает запуск под WSGI и ASGI под нагрузкой:
+    python -m benchmarks.deployment --connections 500
+
+Сценарий serving сравнивает время старта и память воркеров gunicorn:
+    python -m benchmarks.serving
+"""
@@ -0,0 +1,641 @@
+"""Прогон всех маршрутов API с отчётом в JSON.
+
+Засевает временную базу синтетическими данными заданного масштаба и
+прогоняет маршруты api/urls.py через тестовый клиент Django: время
+ответа и число SQL-запросов. С --http читающие маршруты дополнительно
+нагружаются многопоточным HTTP-клиентом через локальный gunicorn.
+Датасет и порядок запросов задаются --seed, так что прогоны на разных
+коммитах сравнимы: --output сохраняет результат, --compare сравнивает
+его с сохранённым и завершается с ошибкой при регрессии.
+"""
+import argparse
+import base64
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.utils import (setup_django, summary, temporary_media,
+                              test_database)
+
+PASSWORD = 'Benchmark-Pa55word'
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAACVBMVEUAAAD///9fX1/S0e'
+    'cCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOyYQAAAABJRU5E'
+    'rkJggg=='
+)
+
+Call = namedtuple(
+    'Call', 'method path data user content_type',
+    defaults=(None, None, None)
+)
+
+
+class Dataset:
+    """Идентификаторы засеянных данных, из которых строятся запросы."""
+
+    def __init__(self, args):
+        from benchmarks import fixtures
+        from django.contrib.auth.hashers import make_password
+        from django.core.management import call_command
+        from foodgram.models import Ingredient, RecipeIngredient, Tag
+        from users.models import User
+
+        self.user_ids = fixtures.make_users(args.users)
+        User.objects.filter(pk__in=self.user_ids).update(
+            password=make_password(PASSWORD)
+        )
+        self.author_ids = self.user_ids[:args.authors]
+        self.readers = self.user_ids[-args.readers:]
+        self.actor = self.user_ids[args.authors]
+        self.admin = self.user_ids[args.authors + 1]
+        User.objects.filter(pk=self.admin).update(is_staff=True)
+        self.vocabulary = fixtures.make_vocabulary()
+        self.ingredient_ids = fixtures.make_ingredients()
+        self.tag_ids = fixtures.make_tags()
+        self.recipe_ids = fixtures.make_recipes(
+            args.recipes, self.author_ids, self.ingredient_ids,
+            self.tag_ids, vocabulary=self.vocabulary
+        )
+        fixtures.make_favorites(
+            self.readers, self.recipe_ids, args.favorites_per_user
+        )
+        fixtures.make_carts(
+            self.readers, self.recipe_ids, args.recipes_per_cart
+        )
+        fixtures.make_subscriptions(
+            [user_id for user_id in self.user_ids if user_id != self.actor],
+            self.author_ids, args.subscriptions
+        )
+        fixtures.make_feeds(self.readers)
+        call_command('refresh_recipe_scores', stdout=io.StringIO())
+        self.tokens = fixtures.make_tokens(self.user_ids)
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.ingredient_prefixes = sorted({
+            name[:3] for name in Ingredient.objects.filter(
+                pk__in=random.sample(self.ingredient_ids, 100)
+            ).values_list('name', flat=True)
+        })
+        self.compositions = {}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=random.sample(self.recipe_ids, 100)
+        ).values_list('recipe_id', 'ingredient_id'):
+            self.compositions.setdefault(recipe_id, []).append(ingredient_id)
+
+    def restore_tokens(self):
+        """Возвращает токены, удалённые прогоном выхода из системы."""
+        from benchmarks import fixtures
+        self.tokens.update(fixtures.make_tokens(self.user_ids))
+
+    def actor_recipes(self):
+        from foodgram.models import Recipe
+        return list(Recipe.objects.filter(
+            author_id=self.actor
+        ).order_by('id').values_list('id', flat=True))
+
+    def recipe_payload(self, index):
+        ingredient_ids = random.sample(self.ingredient_ids, 5)
+        return {
+            'ingredients': [
+                {'id': ingredient_id, 'amount': random.randint(1, 500)}
+                for ingredient_id in ingredient_ids
+            ],
+            'tags': random.sample(self.tag_ids, 2),
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(PNG).decode(),
+            'name': f'Рецепт бенчмарка {index}',
+            'text': ' '.join(random.choices(self.vocabulary, k=40)),
+            'cooking_time': random.randint(5, 120),
+        }
+
+
+def reads(data):
+    """Читающие маршруты: {название: бесконечный генератор запросов}."""
+    recipes = data.recipe_ids
+    pages = max(1, len(recipes) // 6)
+
+    def each(make):
+        return (make(index) for index in itertools.count())
+
+    def reader(index):
+        return data.readers[index % len(data.readers)]
+
+    return {
+        'GET /api/tags/': each(lambda i: Call('GET', '/api/tags/')),
+        'GET /api/tags/{id}/': each(lambda i: Call(
+            'GET', f'/api/tags/{random.choice(data.tag_ids)}/'
+        )),
+        'GET /api/ingredients/?name=': each(lambda i: Call(
+            'GET', '/api/ingredients/',
+            {'name': random.choice(data.ingredient_prefixes)}
+        )),
+        'GET /api/ingredients/{id}/': each(lambda i: Call(
+            'GET', f'/api/ingredients/{random.choice(data.ingredient_ids)}/'
+        )),
+        'GET /api/recipes/ (anonymous)': each(lambda i: Call(
+            'GET', '/api/recipes/', {'page': random.randint(1, pages)}
+        )),
+        'GET /api/recipes/': each(lambda i: Call(
+            'GET', '/api/recipes/', {'page': random.randint(1, pages)},
+            reader(i)
+        )),
+        'GET /api/recipes/?pagination=cursor': each(lambda i: Call(
+            'GET', '/api/recipes/', {'pagination': 'cursor'}, reader(i)
+        )),
+        'GET /api/recipes/?tags=': each(lambda i: Call(
+            'GET', '/api/recipes/', {'tags': random.choice(data.tag_slugs)},
+            reader(i)
+        )),
+        'GET /api/recipes/?is_favorited=1': each(lambda i: Call(
+            'GET', '/api/recipes/', {'is_favorited': 1}, reader(i)
+        )),
+        'GET /api/recipes/?is_in_shopping_cart=1': each(lambda i: Call(
+            'GET', '/api/recipes/', {'is_in_shopping_cart': 1}, reader(i)
+        )),
+        'GET /api/recipes/?search=': each(lambda i: Call(
+            'GET', '/api/recipes/',
+            {'search': random.choice(data.vocabulary[:200])}, reader(i)
+        )),
+        'GET /api/recipes/?has_ingredients=': each(lambda i: Call(
+            'GET', '/api/recipes/', {
+                'has_ingredients': ','.join(map(str, random.choice(
+                    list(data.compositions.values())
+                ) + random.sample(data.ingredient_ids, 5))),
+                'missing_max': 1,
+            }, reader(i)
+        )),
+        'GET /api/recipes/?ordering=-popular': each(lambda i: Call(
+            'GET', '/api/recipes/', {'ordering': '-popular'}, reader(i)
+        )),
+        'GET /api/recipes/{id}/ (anonymous)': each(lambda i: Call(
+            'GET', f'/api/recipes/{random.choice(recipes)}/'
+        )),
+        'GET /api/recipes/{id}/': each(lambda i: Call(
+            'GET', f'/api/recipes/{random.choice(recipes)}/', None,
+            reader(i)
+        )),
+        'GET /api/recipes/feed/': each(lambda i: Call(
+            'GET', '/api/recipes/feed/', None, reader(i)
+        )),
+        'GET /api/recipes/download_shopping_cart/': each(lambda i: Call(
+            'GET', '/api/recipes/download_shopping_cart/', None, reader(i)
+        )),
+        'GET /api/users/': each(lambda i: Call(
+            'GET', '/api/users/', None, reader(i)
+        )),
+        'GET /api/users/{id}/': each(lambda i: Call(
+            'GET', f'/api/users/{random.choice(data.author_ids)}/', None,
+            reader(i)
+        )),
+        'GET /api/users/me/': each(lambda i: Call(
+            'GET', '/api/users/me/', None, reader(i)
+        )),
+        'GET /api/users/subscriptions/': each(lambda i: Call(
+            'GET', '/api/users/subscriptions/', {'recipes_limit': 3},
+            reader(i)
+        )),
+        'GET /api/cache/stats/': each(lambda i: Call(
+            'GET', '/api/cache/stats/', None, data.admin
+        )),
+        'GET /api/metrics/': each(lambda i: Call(
+            'GET', '/api/metrics/', None, data.admin
+        )),
+    }
+
+
+def on_targets(data, method, template, targets):
+    for target in itertools.cycle(targets):
+        yield Call(method, template.format(target), None, data.actor)
+
+
+def on_batches(data, method, path, targets, size=10):
+    batches = [targets[i:i + size] for i in range(0, len(targets), size)]
+    for batch in itertools.cycle(batches):
+        yield Call(method, path, {'recipes': batch}, data.actor)
+
+
+def create_recipes(data):
+    for index in itertools.count():
+        yield Call('POST', '/api/recipes/', data.recipe_payload(index),
+                   data.actor)
+
+
+def update_recipes(data):
+    for recipe_id in itertools.cycle(data.actor_recipes()):
+        payload = data.recipe_payload(recipe_id)
+        payload['name'] = f'Изменённый рецепт {recipe_id}'
+        yield Call('PATCH', f'/api/recipes/{recipe_id}/', payload, data.actor)
+
+
+def replace_images(data):
+    for recipe_id in itertools.cycle(data.actor_recipes()):
+        yield Call('PUT', f'/api/recipes/{recipe_id}/image/', PNG,
+                   data.actor, 'image/png')
+
+
+def delete_recipes(data):
+    for recipe_id in data.actor_recipes():
+        yield Call('DELETE', f'/api/recipes/{recipe_id}/', None, data.actor)
+
+
+def set_password(data):
+    passwords = itertools.cycle((PASSWORD, PASSWORD[::-1]))
+    current = next(passwords)
+    for new in passwords:
+        yield Call('POST', '/api/users/set_password/', {
+            'current_password': current, 'new_password': new,
+        }, data.actor)
+        current = new
+
+
+def login(data):
+    from users.models import User
+    emails = dict(User.objects.filter(
+        pk__in=data.readers
+    ).values_list('pk', 'email'))
+    for user_id in itertools.cycle(data.readers):
+        yield Call('POST', '/api/auth/token/login/', {
+            'email': emails[user_id], 'password': PASSWORD,
+        })
+
+
+def logout(data):
+    from rest_framework.authtoken.models import Token
+    for user_id in itertools.cycle(data.readers):
+        data.tokens[user_id] = Token.objects.get_or_create(
+            user_id=user_id
+        )[0].key
+        yield Call('POST', '/api/auth/token/logout/', None, user_id)
+
+
+def create_users(data):
+    for index in itertools.count():
+        yield Call('POST', '/api/users/', {
+            'email': f'new{index}@example.com',
+            'username': f'new{index}',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': PASSWORD,
+        })
+
+
+def writes(data):
+    """Изменяющие маршруты в порядке прогона.
+
+    Генераторы готовят данные между запросами, вне замеров: каждая
+    пара добавления и удаления работает с одними и теми же объектами,
+    так что после прогона база возвращается к исходному состоянию.
+    """
+    recipes = data.recipe_ids
+    authors = [
+        user_id for user_id in data.user_ids
+        if user_id not in (data.actor, data.admin)
+    ]
+    return {
+        'POST /api/users/': create_users(data),
+        'POST /api/auth/token/login/': login(data),
+        'POST /api/auth/token/logout/': logout(data),
+        'POST /api/users/set_password/': set_password(data),
+        'POST /api/recipes/': create_recipes(data),
+        'PATCH /api/recipes/{id}/': update_recipes(data),
+        'PUT /api/recipes/{id}/image/': replace_images(data),
+        'POST /api/recipes/{id}/favorite/': on_targets(
+            data, 'POST', '/api/recipes/{}/favorite/', recipes
+        ),
+        'DELETE /api/recipes/{id}/favorite/': on_targets(
+            data, 'DELETE', '/api/recipes/{}/favorite/', recipes
+        ),
+        'POST /api/recipes/{id}/shopping_cart/': on_targets(
+            data, 'POST', '/api/recipes/{}/shopping_cart/', recipes
+        ),
+        'DELETE /api/recipes/{id}/shopping_cart/': on_targets(
+            data, 'DELETE', '/api/recipes/{}/shopping_cart/', recipes
+        ),
+        'POST /api/recipes/favorite/bulk/': on_batches(
+            data, 'POST', '/api/recipes/favorite/bulk/', recipes
+        ),
+        'DELETE /api/recipes/favorite/bulk/': on_batches(
+            data, 'DELETE', '/api/recipes/favorite/bulk/', recipes
+        ),
+        'POST /api/recipes/shopping_cart/bulk/': on_batches(
+            data, 'POST', '/api/recipes/shopping_cart/bulk/', recipes
+        ),
+        'DELETE /api/recipes/shopping_cart/bulk/': on_batches(
+            data, 'DELETE', '/api/recipes/shopping_cart/bulk/', recipes
+        ),
+        'POST /api/users/{id}/subscribe/': on_targets(
+            data, 'POST', '/api/users/{}/subscribe/', authors
+        ),
+        'DELETE /api/users/{id}/subscribe/': on_targets(
+            data, 'DELETE', '/api/users/{}/subscribe/', authors
+        ),
+        'DELETE /api/recipes/{id}/': delete_recipes(data),
+    }
+
+
+class TestClientDriver:
+    """Запросы через тестовый клиент DRF с подсчётом SQL-запросов."""
+
+    def __init__(self, tokens):
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.tokens = tokens
+
+    def __call__(self, call):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        if call.user is None:
+            self.client.credentials()
+        else:
+            self.client.credentials(
+                HTTP_AUTHORIZATION=f'Token {self.tokens[call.user]}'
+            )
+        method = getattr(self.client, call.method.lower())
+        if call.content_type:
+            kwargs = {'content_type': call.content_type}
+        else:
+            kwargs = {'format': None if call.method == 'GET' else 'json'}
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = method(call.path, call.data, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(queries)
+
+
+def run_client(routes, repeat, paths):
+    """Прогоняет каждый маршрут repeat раз, возвращает сводку.
+
+    Первый запрос маршрута прогревочный и в замеры не идёт. Пути
+    отправленных запросов добавляются в paths.
+    """
+    results = {}
+    for name, (driver, calls) in routes.items():
+        timings, queries, errors = [], [], 0
+        for call in itertools.islice(calls, 1):
+            paths.add(call.path)
+            driver(call)
+        for call in itertools.islice(calls, repeat):
+            paths.add(call.path)
+            status, elapsed, count = driver(call)
+            errors += status >= 400
+            timings.append(elapsed * 1000)
+            queries.append(count)
+        if not timings:
+            continue
+        results[name] = {
+            **summary(timings),
+            'count': len(timings),
+            'errors': errors,
+            'queries': sorted(queries)[len(queries) // 2],
+            'queries_max': max(queries),
+        }
+        print(format_row(name, results[name]))
+    return results
+
+
+def format_row(name, stats):
+    row = ' '.join(
+        f'{key}={stats[key]:.2f}ms' for key in ('p50', 'p95', 'p99')
+    )
+    extra = ''
+    if 'queries' in stats:
+        extra += f' queries={stats["queries"]}'
+    if 'rps' in stats:
+        extra += f' rps={stats["rps"]:.1f}'
+    if stats.get('errors'):
+        extra += f' errors={stats["errors"]}'
+    return f'{name:<48} {row}{extra}'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(database, workers, port, app='backend.wsgi', options=(),
+                   environ=None):
+    """Запускает gunicorn на тестовой базе и ждёт первого ответа."""
+    from django.conf import settings
+    env = {
+        **os.environ,
+        **(environ or {}),
+        'DB_ENGINE': database['ENGINE'],
+        'DB_NAME': database['NAME'],
+    }
+    server = subprocess.Popen(
+        (sys.executable, '-m', 'gunicorn.app.wsgiapp', app,
+         '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning', *options),
+        cwd=settings.BASE_DIR,
+        env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn не запустился')
+
+
+def run_http(routes, tokens, port, requests_per_route, threads):
+    """Нагружает читающие маршруты из threads потоков.
+
+    Перед замером каждый маршрут прогревается threads запросами.
+    """
+    import requests
+    local = threading.local()
+
+    def send(call):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        headers = {}
+        if call.user is not None:
+            headers['Authorization'] = f'Token {tokens[call.user]}'
+        start = time.perf_counter()
+        response = session.request(
+            call.method, f'http://127.0.0.1:{port}{call.path}',
+            params=call.data, headers=headers
+        )
+        return response.status_code, time.perf_counter() - start
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for name, calls in routes.items():
+            batch = list(itertools.islice(calls, requests_per_route))
+            list(executor.map(send, batch[:threads]))
+            start = time.perf_counter()
+            responses = list(executor.map(send, batch))
+            wall = time.perf_counter() - start
+            results[name] = {
+                **summary([elapsed * 1000 for _, elapsed in responses]),
+                'count': len(responses),
+                'errors': sum(status >= 400 for status, _ in responses),
+                'rps': len(responses) / wall,
+            }
+            print(format_row(name, results[name]))
+    return results
+
+
+def uncovered_routes(names):
+    """Маршруты api/urls.py, которые прогон не затронул."""
+    from django.urls import URLPattern, URLResolver, get_resolver, resolve
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(
+                    pattern.url_patterns, pattern.namespace or namespace
+                )
+            elif isinstance(pattern, URLPattern) and namespace == 'api':
+                yield f'api:{pattern.name or pattern.lookup_str}'
+
+    covered = {resolve(path).view_name for path in names}
+    return sorted(set(walk(get_resolver().url_patterns, None)) - covered)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline, threshold):
+    """Печатает изменения относительно прошлого прогона.
+
+    Регрессия - рост медианы больше чем на threshold процентов или рост
+    числа SQL-запросов: хвосты при небольшом --repeat слишком шумные.
+    Возвращает число регрессий.
+    """
+    regressions = 0
+    for phase in ('client', 'http'):
+        for name, stats in result.get(phase, {}).items():
+            old = baseline.get(phase, {}).get(name)
+            if old is None:
+                continue
+            change = (stats['p50'] - old['p50']) / old['p50'] * 100
+            queries = stats.get('queries', 0) - old.get('queries', 0)
+            regressed = change > threshold or queries > 0
+            regressions += regressed
+            print(
+                f'{"!" if regressed else " "} {phase:<6} {name:<48} '
+                f'p50 {old["p50"]:.2f} -> {stats["p50"]:.2f}ms '
+                f'({change:+.0f}%), '
+                f'p95 {old["p95"]:.2f} -> {stats["p95"]:.2f}ms'
+                + (f', queries {queries:+d}' if queries else '')
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--authors', type=int, default=100)
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--favorites-per-user', type=int, default=20)
+    parser.add_argument('--recipes-per-cart', type=int, default=10)
+    parser.add_argument('--subscriptions', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--http', action='store_true',
+                        help='Нагрузить читающие маршруты через gunicorn.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--http-requests', type=int, default=400,
+                        help='Запросов на маршрут при нагрузке по HTTP.')
+    parser.add_argument('--output', help='Куда записать результат в JSON.')
+    parser.add_argument('--compare',
+                        help='JSON прошлого прогона для сравнения.')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='Допустимый рост медианы, процентов.')
+    args = parser.parse_args()
+    if args.authors + 2 > args.users - args.readers:
+        parser.error('Пользователей должно хватать на авторов и читателей.')
+    if args.repeat > min(args.recipes, args.users - 2):
+        parser.error('--repeat не может быть больше числа рецептов '
+                     'и пользователей.')
+
+    setup_django()
+    from django.db import connection
+
+    random.seed(args.seed)
+    result = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'args': vars(args),
+    }
+    with tempfile.TemporaryDirectory(prefix='foodgram-benchmark-') as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tmp, 'benchmark.sqlite3'
+            )
+        with test_database(), temporary_media():
+            started = time.perf_counter()
+            data = Dataset(args)
+            print(f'dataset ready in {time.perf_counter() - started:.1f}s: '
+                  f'users={args.users} recipes={args.recipes}')
+            driver = TestClientDriver(data.tokens)
+            routes = {
+                name: (driver, calls)
+                for name, calls in {**reads(data), **writes(data)}.items()
+            }
+            print('--- test client')
+            paths = set()
+            result['client'] = run_client(routes, args.repeat, paths)
+            result['uncovered'] = uncovered_routes(paths)
+            data.restore_tokens()
+            if args.http:
+                print(f'--- http: gunicorn workers={args.workers} '
+                      f'threads={args.threads}')
+                port = free_port()
+                server = start_gunicorn(
+                    connection.settings_dict, args.workers, port
+                )
+                try:
+                    result['http'] = run_http(
+                        reads(data), data.tokens, port,
+                        args.http_requests, args.threads
+                    )
+                finally:
+                    server.terminate()
+                    server.wait()
+    if result['uncovered']:
+        print('not covered:', ', '.join(result['uncovered']))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        print(f'--- compared with {baseline.get("revision")}')
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
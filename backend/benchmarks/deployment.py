@@ -0,0 +1,228 @@
+"""Сравнение развёртываний WSGI и ASGI под множеством соединений.
+
+Засевает временную базу и по очереди поднимает gunicorn с синхронными
+воркерами (backend.wsgi, как в Dockerfile) и с воркерами uvicorn
+(backend.asgi). Каждый маршрут нагружается --connections одновременными
+соединениями из асинхронного HTTP-клиента: печатаются пропускная
+способность, перцентили задержки, ошибки и таймауты. Клиент работает на
+той же машине, что и сервер, так что сравнивать стоит прогоны друг с
+другом, а не с продом.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from benchmarks.api import (Dataset, format_row, free_port, reads,
+                            start_gunicorn)
+from benchmarks.utils import (setup_django, summary, temporary_media,
+                              test_database)
+
+DEPLOYMENTS = {'wsgi': 'backend.wsgi', 'asgi': 'backend.asgi'}
+TIMEOUT, ERROR = -1, 0
+ROUTES = (
+    'GET /api/tags/',
+    'GET /api/recipes/ (anonymous)',
+    'GET /api/recipes/{id}/ (anonymous)',
+    'GET /api/recipes/',
+)
+
+
+class Connection:
+    """Одно keep-alive соединение HTTP/1.1 без сторонних библиотек."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, path, headers):
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(
+                '127.0.0.1', self.port
+            )
+        lines = [f'GET {path} HTTP/1.1', 'Host: 127.0.0.1', *(
+            f'{name}: {value}' for name, value in headers.items()
+        )]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        status_line = await self.reader.readline()
+        if not status_line and reused:
+            self.close()
+            return await self.request(path, headers)
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = (await self.reader.readline()).strip()
+            if not line:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        await self.read_body(response_headers)
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    async def read_body(self, headers):
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+            return
+        if headers.get('transfer-encoding', '').lower() != 'chunked':
+            await self.reader.read()
+            self.close()
+            return
+        while True:
+            size = int((await self.reader.readline()).strip(), 16)
+            await self.reader.readexactly(size + 2)
+            if not size:
+                return
+
+
+async def load(port, calls, tokens, connections, timeout):
+    """Прогоняет calls через connections одновременных соединений."""
+    results = []
+    pending = iter(calls)
+
+    async def worker():
+        connection = Connection(port)
+        for call in pending:
+            path = call.path
+            if call.data:
+                path = f'{path}?{urlencode(call.data, doseq=True)}'
+            headers = {'Accept': 'application/json'}
+            if call.user is not None:
+                headers['Authorization'] = f'Token {tokens[call.user]}'
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    connection.request(path, headers), timeout
+                )
+            except asyncio.TimeoutError:
+                status = TIMEOUT
+                connection.close()
+            except (OSError, ValueError, IndexError,
+                    asyncio.IncompleteReadError):
+                status = ERROR
+                connection.close()
+            results.append((status, time.perf_counter() - start))
+        connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return results, time.perf_counter() - start
+
+
+def run_deployment(name, data, args, database):
+    app = DEPLOYMENTS[name]
+    options = ()
+    if name == 'asgi':
+        options = ('--worker-class', args.asgi_worker)
+    port = free_port()
+    server = start_gunicorn(database, args.workers, port, app, options)
+    routes = reads(data)
+    results = {}
+    try:
+        for route in args.routes:
+            calls = list(itertools.islice(routes[route], args.requests))
+            asyncio.run(load(
+                port, calls[:args.connections], data.tokens,
+                args.connections, args.timeout
+            ))
+            responses, wall = asyncio.run(load(
+                port, calls, data.tokens, args.connections, args.timeout
+            ))
+            statuses = [status for status, _ in responses]
+            results[route] = {
+                **summary([elapsed * 1000 for _, elapsed in responses]),
+                'count': len(responses),
+                'errors': sum(
+                    status == ERROR or status >= 400 for status in statuses
+                ),
+                'timeouts': statuses.count(TIMEOUT),
+                'rps': len(responses) / wall,
+            }
+            print(f'{name} {format_row(route, results[route])} '
+                  f'max={results[route]["max"]:.2f}ms '
+                  f'timeouts={results[route]["timeouts"]}')
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def print_comparison(result, args):
+    """Сводка p99 и rps по маршрутам для всех развёртываний рядом."""
+    print(f'--- p99 / rps при {args.connections} соединениях')
+    for route in args.routes:
+        print(f'{route:<48} ' + '  '.join(
+            f'{name}: {result[name][route]["p99"]:.1f}ms '
+            f'{result[name][route]["rps"]:.1f}rps'
+            for name in args.deployments
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=50)
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--favorites-per-user', type=int, default=20)
+    parser.add_argument('--recipes-per-cart', type=int, default=10)
+    parser.add_argument('--subscriptions', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--asgi-worker',
+                        default='uvicorn.workers.UvicornWorker',
+                        help='Класс воркера gunicorn для backend.asgi; '
+                             'UvicornH11Worker обходится без uvloop и '
+                             'httptools.')
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='Запросов на маршрут.')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Таймаут одного запроса, секунд.')
+    parser.add_argument('--routes', nargs='+', default=ROUTES,
+                        help='Маршруты из benchmarks.api.reads.')
+    parser.add_argument('--deployments', nargs='+', default=list(DEPLOYMENTS),
+                        choices=list(DEPLOYMENTS))
+    parser.add_argument('--output', help='Куда записать результат в JSON.')
+    args = parser.parse_args()
+    if args.authors + 2 > args.users - args.readers:
+        parser.error('Пользователей должно хватать на авторов и читателей.')
+
+    setup_django()
+    from django.db import connection
+
+    random.seed(args.seed)
+    result = {'args': vars(args)}
+    with tempfile.TemporaryDirectory(prefix='foodgram-benchmark-') as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tmp, 'benchmark.sqlite3'
+            )
+        with test_database(), temporary_media():
+            data = Dataset(args)
+            for name in args.deployments:
+                print(f'--- {name}: workers={args.workers} '
+                      f'connections={args.connections}')
+                result[name] = run_deployment(
+                    name, data, args, connection.settings_dict
+                )
+    print_comparison(result, args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
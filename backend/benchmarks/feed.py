@@ -0,0 +1,96 @@
+"""Лента подписок: раскладка при публикации и чтение ленты."""
+import argparse
+import random
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--authors', type=int, default=500)
+    parser.add_argument('--subscriptions', type=int, default=10)
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from benchmarks import fixtures
+    from django.conf import settings
+    from django.db import connection
+    from django.db.models import Count
+    from django.test.utils import CaptureQueriesContext
+    from foodgram.models import FeedEntry, Recipe
+    from rest_framework.test import APIClient
+    from users.models import User
+
+    with test_database():
+        user_ids = fixtures.make_users(args.users)
+        author_ids = user_ids[:args.authors]
+        fixtures.make_subscriptions(
+            user_ids, author_ids, args.subscriptions
+        )
+        followers = dict(User.objects.filter(id__in=author_ids).annotate(
+            followers=Count('subscribed')
+        ).values_list('id', 'followers'))
+        popular = sum(
+            count > settings.FEED_FANOUT_LIMIT for count in followers.values()
+        )
+        print(f'users={args.users} authors={args.authors} '
+              f'max followers={max(followers.values())} '
+              f'popular authors (> {settings.FEED_FANOUT_LIMIT}): {popular}')
+
+        recipe_ids = fixtures.make_recipes(
+            args.recipes,
+            author_ids,
+            fixtures.make_ingredients(),
+            fixtures.make_tags()
+        )
+        recipes = iter(Recipe.objects.filter(id__in=recipe_ids))
+        report('fan-out on publish', measure(
+            lambda: FeedEntry.objects.fan_out(next(recipes)),
+            len(recipe_ids)
+        ))
+        print(f'feed entries: {FeedEntry.objects.count()}')
+
+        readers = random.sample(user_ids, min(args.repeat, len(user_ids)))
+        users = iter(User.objects.filter(id__in=readers))
+        report('feed page, timeline', measure(
+            lambda: list(Recipe.objects.feed(next(users))[:6]), len(readers)
+        ))
+        users = iter(User.objects.filter(id__in=readers))
+        report('feed page, join on subscriptions', measure(
+            lambda: list(Recipe.objects.filter(
+                author__subscribed__user=next(users)
+            )[:6]),
+            len(readers)
+        ))
+
+        client = APIClient()
+        users = iter(User.objects.filter(id__in=readers))
+
+        def feed_request():
+            client.force_authenticate(next(users))
+            response = client.get('/api/recipes/feed/')
+            assert response.status_code == 200, response.content
+
+        def subscriptions_request():
+            client.force_authenticate(next(users))
+            response = client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            )
+            assert response.status_code == 200, response.content
+
+        for title, func in (
+            ('GET /api/recipes/feed/', feed_request),
+            ('GET /api/users/subscriptions/', subscriptions_request),
+        ):
+            users = iter(User.objects.filter(id__in=readers))
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            title = f'{title} ({len(queries)} queries)'
+            report(title, measure(func, len(readers) - 1))
+
+
+if __name__ == '__main__':
+    main()
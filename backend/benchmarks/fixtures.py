@@ -0,0 +1,185 @@
+import csv
+import io
+import itertools
+import os
+import random
+
+from django.conf import settings
+from django.core.management import call_command
+
+INGREDIENTS_CSV = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+BATCH_SIZE = 450
+
+
+def reconcile_counters():
+    """Пересчитывает счётчики после массовой вставки мимо API."""
+    call_command('reconcile_counters', stdout=io.StringIO())
+
+
+def make_users(count, prefix='bench'):
+    from users.models import User
+    User.objects.bulk_create(
+        (User(
+            username=f'{prefix}{index}',
+            email=f'{prefix}{index}@example.com',
+            first_name='Имя',
+            last_name='Фамилия',
+        ) for index in range(count)),
+        batch_size=BATCH_SIZE
+    )
+    return list(User.objects.filter(
+        username__startswith=prefix
+    ).order_by('id').values_list('id', flat=True))
+
+
+def make_tags():
+    from foodgram.models import Tag
+    for slug, name, color in (
+        ('breakfast', 'Завтрак', '#E26C2D'),
+        ('lunch', 'Обед', '#49B64E'),
+        ('dinner', 'Ужин', '#8775D2'),
+    ):
+        Tag.objects.get_or_create(
+            slug=slug, defaults={'name': name, 'color': color}
+        )
+    return list(Tag.objects.values_list('id', flat=True))
+
+
+def make_ingredients():
+    from foodgram.models import Ingredient
+    with open(INGREDIENTS_CSV, encoding='utf-8') as file:
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in csv.reader(file)),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+    return list(Ingredient.objects.values_list('id', flat=True))
+
+
+def make_vocabulary():
+    """Слова из названий ингредиентов в случайном порядке."""
+    with open(INGREDIENTS_CSV, encoding='utf-8') as file:
+        words = sorted({
+            word for name, _ in csv.reader(file)
+            for word in name.lower().split() if word.isalpha()
+        })
+    return random.sample(words, len(words))
+
+
+def make_recipes(count, author_ids, ingredient_ids, tag_ids,
+                 ingredients_per_recipe=8, vocabulary=None, text_words=60):
+    """Рецепты со случайным составом.
+
+    С vocabulary названия и описания составляются из его слов
+    с распределением Ципфа, как в живом языке, - это данные для
+    замеров полнотекстового поиска.
+    """
+    from foodgram.models import Recipe, RecipeIngredient
+    if vocabulary:
+        cum_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)
+        ))
+
+    def texts(index):
+        if not vocabulary:
+            return f'Рецепт {index}', f'Описание рецепта {index}'
+        name = ' '.join(random.choices(vocabulary, cum_weights=cum_weights,
+                                       k=3))
+        text = ' '.join(random.choices(vocabulary, cum_weights=cum_weights,
+                                       k=text_words))
+        return f'{name} {index}'.capitalize(), text.capitalize()
+
+    Recipe.objects.bulk_create(
+        (Recipe(
+            name=name,
+            author_id=random.choice(author_ids),
+            image='recipe/benchmark.jpg',
+            text=text,
+            cooking_time=random.randint(5, 120),
+        ) for name, text in map(texts, range(count))),
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    RecipeIngredient.objects.bulk_create(
+        (RecipeIngredient(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=random.randint(1, 500),
+        ) for recipe_id in recipe_ids for ingredient_id in random.sample(
+            ingredient_ids, ingredients_per_recipe
+        )),
+        batch_size=BATCH_SIZE
+    )
+    Tags = Recipe.tags.through
+    Tags.objects.bulk_create(
+        (Tags(recipe_id=recipe_id, tag_id=random.choice(tag_ids))
+         for recipe_id in recipe_ids),
+        batch_size=BATCH_SIZE
+    )
+    reconcile_counters()
+    return recipe_ids
+
+
+def make_carts(user_ids, recipe_ids, recipes_per_cart):
+    from foodgram.models import ShoppingCartIngredient, ShoppingList
+    ShoppingList.objects.bulk_create(
+        (ShoppingList(user_id=user_id, recipe_id=recipe_id)
+         for user_id in user_ids
+         for recipe_id in random.sample(recipe_ids, recipes_per_cart)),
+        batch_size=BATCH_SIZE
+    )
+    ShoppingCartIngredient.objects.rebuild(user_ids)
+    reconcile_counters()
+
+
+def make_subscriptions(user_ids, author_ids, per_user, skew=1.1):
+    """Подписки с распределением Ципфа: немногие авторы собирают
+    большинство подписчиков."""
+    from users.models import Subscription
+    weights = [1 / rank ** skew for rank in range(1, len(author_ids) + 1)]
+    Subscription.objects.bulk_create(
+        (Subscription(user_id=user_id, author_id=author_id)
+         for user_id in user_ids
+         for author_id in set(random.choices(
+             author_ids, weights, k=per_user
+         )) if author_id != user_id),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    reconcile_counters()
+
+
+def make_favorites(user_ids, recipe_ids, per_user):
+    from foodgram.models import Favorite
+    Favorite.objects.bulk_create(
+        (Favorite(user_id=user_id, recipe_id=recipe_id)
+         for user_id in user_ids
+         for recipe_id in random.sample(recipe_ids, per_user)),
+        batch_size=BATCH_SIZE
+    )
+    reconcile_counters()
+
+
+def make_feeds(user_ids):
+    """Заполняет ленты пользователей рецептами авторов их подписок."""
+    from foodgram.models import FeedEntry
+    from users.models import Subscription
+    for subscription in Subscription.objects.filter(
+        user_id__in=user_ids
+    ).select_related('user', 'author'):
+        FeedEntry.objects.backfill(subscription.user, subscription.author)
+
+
+def make_tokens(user_ids):
+    """Токены авторизации пользователей, {id пользователя: ключ}."""
+    from rest_framework.authtoken.models import Token
+    Token.objects.bulk_create(
+        (Token(user_id=user_id, key=Token.generate_key())
+         for user_id in user_ids),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    return dict(Token.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', 'key'))
@@ -0,0 +1,78 @@
+"""Подбор рецептов по имеющимся ингредиентам: индекс против соединений."""
+import argparse
+import random
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+    parser.add_argument('--have', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from benchmarks import fixtures
+    from django.db.models import Count, F, Q
+    from foodgram.indexes import recipe_ingredient_index
+    from foodgram.models import Recipe, RecipeIngredient
+
+    with test_database():
+        ingredient_ids = fixtures.make_ingredients()
+        fixtures.make_recipes(
+            args.recipes,
+            fixtures.make_users(100),
+            ingredient_ids,
+            fixtures.make_tags(),
+            ingredients_per_recipe=args.ingredients_per_recipe
+        )
+        popular = list(RecipeIngredient.objects.values_list(
+            'ingredient_id', flat=True
+        ).annotate(total=Count('id')).order_by('-total')[:200])
+        pantries = [
+            random.sample(popular, args.have) for _ in range(args.repeat)
+        ]
+        report('index load', measure(
+            lambda: recipe_ingredient_index.load(None), 3
+        ))
+        recipe_ingredient_index.ensure_loaded()
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        report('index update, one recipe', measure(
+            lambda: recipe_ingredient_index.update([
+                random.choice(recipe_ids)
+            ]), args.repeat
+        ))
+        print(f'recipes={args.recipes} '
+              f'ingredients per recipe={args.ingredients_per_recipe} '
+              f'pantry={args.have}')
+
+        for missing_max in (0, 2, 4):
+            have = iter(pantries)
+            report(f'index, missing_max={missing_max}', measure(
+                lambda: recipe_ingredient_index.match(
+                    next(have), missing_max, 1000
+                ),
+                len(pantries)
+            ))
+            have = iter(pantries)
+
+            def join_query():
+                ids = next(have)
+                return list(Recipe.objects.annotate(
+                    size=Count('recipeingredient'),
+                    hits=Count('recipeingredient', filter=Q(
+                        recipeingredient__ingredient_id__in=ids
+                    ))
+                ).filter(
+                    hits__gt=0, hits__gte=F('size') - missing_max
+                ).values_list('id', flat=True)[:1000])
+
+            report(f'GROUP BY query, missing_max={missing_max}', measure(
+                join_query, len(pantries)
+            ))
+
+
+if __name__ == '__main__':
+    main()
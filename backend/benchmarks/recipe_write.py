@@ -0,0 +1,77 @@
+"""Пропускная способность создания и обновления рецептов через API."""
+import argparse
+import itertools
+import random
+
+from benchmarks.utils import (measure, report, setup_django, temporary_media,
+                              test_database)
+
+IMAGE = (
+    'data:image/gif;base64,'
+    'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ingredients', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from benchmarks import fixtures
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+    from users.models import User
+
+    with test_database(), temporary_media():
+        author_id, = fixtures.make_users(1)
+        ingredient_ids = fixtures.make_ingredients()
+        tag_ids = fixtures.make_tags()
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=author_id))
+        names = itertools.count()
+        created = []
+
+        def payload():
+            return {
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': random.randint(1, 500)}
+                    for ingredient_id in random.sample(
+                        ingredient_ids, args.ingredients
+                    )
+                ],
+                'tags': tag_ids,
+                'image': IMAGE,
+                'name': f'Рецепт {next(names)}',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }
+
+        def create():
+            response = client.post('/api/recipes/', payload(), format='json')
+            assert response.status_code == 201, response.content
+            created.append(response.data['id'])
+
+        def update():
+            response = client.patch(
+                f'/api/recipes/{random.choice(created)}/',
+                payload(),
+                format='json'
+            )
+            assert response.status_code == 200, response.content
+
+        print(f'ingredients per recipe={args.ingredients}')
+        for title, func in (('create', create), ('update', update)):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            title = f'{title} ({len(queries)} queries)'
+            timings = measure(func, args.repeat)
+            report(title, timings)
+            print(f'{title} throughput: '
+                  f'{1000 * len(timings) / sum(timings):.1f} req/s')
+
+
+if __name__ == '__main__':
+    main()
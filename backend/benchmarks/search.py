@@ -0,0 +1,63 @@
+"""Полнотекстовый поиск рецептов: частые, редкие и составные запросы."""
+import argparse
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from benchmarks import fixtures
+    from foodgram.models import Recipe
+    from foodgram.search import search_recipes
+    from rest_framework.test import APIClient
+    from users.models import User
+
+    with test_database():
+        vocabulary = fixtures.make_vocabulary()
+        author_ids = fixtures.make_users(100)
+        fixtures.make_recipes(
+            args.recipes,
+            author_ids,
+            fixtures.make_ingredients(),
+            fixtures.make_tags(),
+            ingredients_per_recipe=0,
+            vocabulary=vocabulary,
+            text_words=args.words
+        )
+        queries = {
+            'frequent word': vocabulary[0],
+            'median word': vocabulary[len(vocabulary) // 2],
+            'rare word': vocabulary[-1],
+            'two words': f'{vocabulary[1]} {vocabulary[5]}',
+            'prefix': vocabulary[2][:4],
+        }
+        print(f'recipes={args.recipes} vocabulary={len(vocabulary)} '
+              f'words per recipe={args.words}')
+
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=author_ids[0]))
+        for title, query in queries.items():
+            found = search_recipes(Recipe.objects.all(), query).count()
+            report(f'{title} ({found} found), top 6', measure(
+                lambda: list(search_recipes(
+                    Recipe.objects.all(), query
+                ).order_by('-search_rank', '-id')[:6]),
+                args.repeat
+            ))
+            report(f'{title}, GET ?pagination=cursor', measure(
+                lambda: client.get(
+                    '/api/recipes/',
+                    {'search': query, 'pagination': 'cursor'}
+                ),
+                args.repeat
+            ))
+
+
+if __name__ == '__main__':
+    main()
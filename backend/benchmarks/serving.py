@@ -0,0 +1,193 @@
+"""Холодный старт и память воркеров gunicorn в разных профилях.
+
+Профили: dockerfile - прежняя команда из Dockerfile без конфига
+(синхронные воркеры, без preload), no-preload и preload - профиль
+gunicorn.conf.py без загрузки приложения в мастере и с ней. Для каждого
+меряются время от запуска до первого ответа, задержка первых запросов
+к маршрутам с кэшами в памяти процесса и память воркеров после
+нагрузки: RSS, PSS (общие страницы делятся между процессами) и
+собственная память процесса.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.api import Dataset, free_port, reads, run_http, start_gunicorn
+from benchmarks.utils import (setup_django, summary, temporary_media,
+                              test_database)
+
+CONFIG = ('--config', 'gunicorn.conf.py')
+PROFILES = {
+    # Пакет benchmarks как конфиг: настроек в нём нет, действуют
+    # значения gunicorn по умолчанию, как без gunicorn.conf.py.
+    'dockerfile': (('--config', 'python:benchmarks'), {}),
+    'no-preload': (CONFIG, {'GUNICORN_PRELOAD': '0'}),
+    'preload': (CONFIG, {'GUNICORN_PRELOAD': '1'}),
+}
+FIRST_ROUTES = (
+    'GET /api/tags/',
+    'GET /api/ingredients/?name=',
+    'GET /api/recipes/?has_ingredients=',
+    'GET /api/recipes/',
+)
+LOAD_ROUTES = (
+    'GET /api/tags/',
+    'GET /api/ingredients/?name=',
+    'GET /api/recipes/ (anonymous)',
+    'GET /api/recipes/',
+    'GET /api/recipes/{id}/',
+    'GET /api/recipes/?has_ingredients=',
+    'GET /api/users/me/',
+)
+
+
+def send(port, call, tokens):
+    """Запрос по новому соединению: код ответа и время, мс."""
+    import requests
+    headers = {}
+    if call.user is not None:
+        headers['Authorization'] = f'Token {tokens[call.user]}'
+    start = time.perf_counter()
+    response = requests.request(
+        call.method, f'http://127.0.0.1:{port}{call.path}',
+        params=call.data, headers=headers
+    )
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+
+def wait_ready(port, started, timeout=60):
+    """Секунды от started до первого ответа 200."""
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(f'http://127.0.0.1:{port}/api/tags/')
+        except requests.ConnectionError:
+            response = None
+        if response is not None and response.status_code == 200:
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    raise RuntimeError('gunicorn не ответил')
+
+
+def first_requests(port, routes, tokens, count):
+    """Самый медленный из count одновременных первых запросов маршрута."""
+    result = {}
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        for name in FIRST_ROUTES:
+            calls = list(itertools.islice(routes[name], count))
+            responses = list(executor.map(
+                lambda call: send(port, call, tokens), calls
+            ))
+            result[name] = max(elapsed for _, elapsed in responses)
+    return result
+
+
+def memory(pid):
+    """RSS, PSS и собственная память процесса в МБ из smaps_rollup."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                values[name] = int(value.split()[0]) / 1024
+    return {
+        'rss': values['Rss'],
+        'pss': values['Pss'],
+        'private': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def worker_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return [int(child) for child in file.read().split()]
+
+
+def run_profile(name, data, args, database):
+    options, environ = PROFILES[name]
+    port = free_port()
+    started = time.perf_counter()
+    server = start_gunicorn(
+        database, args.workers, port, options=options, environ=environ
+    )
+    try:
+        ready = wait_ready(port, started)
+        routes = reads(data)
+        first = first_requests(port, routes, data.tokens, 2 * args.workers)
+        run_http(
+            {route: routes[route] for route in LOAD_ROUTES}, data.tokens,
+            port, args.requests, args.threads
+        )
+        workers = [memory(pid) for pid in worker_pids(server.pid)]
+        master = memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    result = {
+        'ready': ready,
+        'first_requests': first,
+        'master': master,
+        'workers': {
+            key: summary([worker[key] for worker in workers])['mean']
+            for key in ('rss', 'pss', 'private')
+        },
+        'total_pss': master['pss'] + sum(worker['pss'] for worker in workers),
+    }
+    print(f'{name}: ready={ready:.2f}s ' + ' '.join(
+        f'{key}={value:.1f}MB' for key, value in result['workers'].items()
+    ) + f' total_pss={result["total_pss"]:.1f}MB')
+    for route, elapsed in first.items():
+        print(f'    first {route:<40} {elapsed:.1f}ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=50)
+    parser.add_argument('--readers', type=int, default=50)
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--favorites-per-user', type=int, default=20)
+    parser.add_argument('--recipes-per-cart', type=int, default=10)
+    parser.add_argument('--subscriptions', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Потоков клиента при нагрузке.')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='Запросов на маршрут перед замером памяти.')
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES),
+                        choices=list(PROFILES))
+    parser.add_argument('--output', help='Куда записать результат в JSON.')
+    args = parser.parse_args()
+    if args.authors + 2 > args.users - args.readers:
+        parser.error('Пользователей должно хватать на авторов и читателей.')
+
+    setup_django()
+    from django.db import connection
+
+    random.seed(args.seed)
+    result = {'args': vars(args)}
+    with tempfile.TemporaryDirectory(prefix='foodgram-benchmark-') as tmp:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tmp, 'benchmark.sqlite3'
+            )
+        with test_database(), temporary_media():
+            data = Dataset(args)
+            for name in args.profiles:
+                result[name] = run_profile(
+                    name, data, args, connection.settings_dict
+                )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Сравнение выгрузки корзины: агрегация на лету и готовый агрегат."""
+import argparse
+import random
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument('--carts', type=int, default=100)
+    parser.add_argument('--recipes-per-cart', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from benchmarks import fixtures
+    from django.db.models import Sum
+    from foodgram.models import RecipeIngredient, ShoppingCartIngredient
+
+    with test_database():
+        user_ids = fixtures.make_users(args.carts)
+        recipe_ids = fixtures.make_recipes(
+            args.recipes,
+            user_ids,
+            fixtures.make_ingredients(),
+            fixtures.make_tags()
+        )
+        fixtures.make_carts(user_ids, recipe_ids, args.recipes_per_cart)
+
+        def aggregate_on_the_fly():
+            list(RecipeIngredient.objects.filter(
+                recipe__shoppinglist__user_id=random.choice(user_ids)
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(amount=Sum('amount')).order_by('ingredient__name'))
+
+        def precomputed():
+            list(ShoppingCartIngredient.objects.filter(
+                user_id=random.choice(user_ids)
+            ).values(
+                'ingredient__name', 'ingredient__measurement_unit', 'amount'
+            ).order_by('ingredient__name'))
+
+        print(f'recipes={args.recipes} carts={args.carts} '
+              f'recipes_per_cart={args.recipes_per_cart}')
+        report('aggregate on the fly', measure(
+            aggregate_on_the_fly, args.repeat
+        ))
+        report('precomputed aggregate', measure(precomputed, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Временная тестовая база на время бенчмарка."""
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def temporary_media():
+    """Временный MEDIA_ROOT для файлов, загруженных в бенчмарке."""
+    from django.test import override_settings
+    media_root = tempfile.mkdtemp(prefix='foodgram-benchmark-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            yield media_root
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+def measure(func, repeat):
+    """Время выполнения func в миллисекундах, repeat замеров."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings, share):
+    """Перцентиль по уже отсортированным замерам."""
+    return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        'mean': statistics.mean(timings),
+        'p50': percentile(timings, 0.5),
+        'p95': percentile(timings, 0.95),
+        'p99': percentile(timings, 0.99),
+        'max': timings[-1],
+    }
+
+
+def report(title, timings):
+    stats = summary(timings)
+    print(
+        f'{title:<40} ' + ' '.join(
+            f'{key}={value:.2f}ms' for key, value in stats.items()
+        )
+    )
@@ -12,7 +12,7 @@ class RecipeAdmin(admin.ModelAdmin):
     readonly_fields = ('count_favorites',)
 
     def count_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'Добавлено в избранное, раз'
 
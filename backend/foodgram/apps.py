@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FoodgramConfig(AppConfig):
     name = 'foodgram'
+
+    def ready(self):
+        from . import signals  # noqa: F401
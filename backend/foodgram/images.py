@@ -0,0 +1,231 @@
+"""Загрузка картинок рецептов и нарезка уменьшенных копий.
+
+Оригинал из base64 декодируется кусками во временный файл, загруженный
+файл принимается как есть. Картинка сохраняется под именем из хэша
+содержимого, поэтому одинаковые картинки хранятся один раз. Уменьшенные
+копии в WebP и JPEG готовит пул потоков после коммита, и только тогда
+у рецепта выставляется image_processed.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+DECODE_CHUNK_SIZE = 1 << 16
+SPOOL_SIZE = 1 << 20
+MAX_PIXELS = 50_000_000
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+QUALITY = 82
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class ImageError(ValueError):
+    """Переданные данные не являются допустимой картинкой."""
+
+
+def decode_base64(data):
+    """Декодирует data URL во временный файл, считая sha256 по пути.
+
+    Возвращает файл, открытый на начале, и hex-хэш содержимого.
+    """
+    _, separator, payload = data.rpartition(';base64,')
+    if not separator:
+        payload = data
+    if len(payload) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ImageError('Картинка слишком большая.')
+    digest = hashlib.sha256()
+    decoded = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+            chunk = base64.b64decode(
+                payload[start:start + DECODE_CHUNK_SIZE], validate=True
+            )
+            digest.update(chunk)
+            decoded.write(chunk)
+    except (binascii.Error, ValueError):
+        decoded.close()
+        raise ImageError('Не удалось декодировать картинку.')
+    decoded.seek(0)
+    return decoded, digest.hexdigest()
+
+
+def inspect_image(file):
+    """Проверяет картинку по заголовку и возвращает её формат Pillow."""
+    try:
+        with Image.open(file) as image:
+            if image.format not in EXTENSIONS:
+                raise ImageError('Неподдерживаемый формат картинки.')
+            width, height = image.size
+            if width * height > MAX_PIXELS:
+                raise ImageError('Картинка слишком большая.')
+            image.verify()
+            image_format = image.format
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ImageError('Загрузите корректную картинку.')
+    file.seek(0)
+    return image_format
+
+
+def upload_name(digest, image_format):
+    """Путь оригинала в хранилище по хэшу содержимого."""
+    return Recipe._meta.get_field('image').generate_filename(
+        None, f'{digest[:32]}.{EXTENSIONS[image_format]}'
+    )
+
+
+def store(file, digest):
+    """Готовит файл картинки к сохранению в Recipe.image.
+
+    Если такая картинка уже загружена, возвращает путь к ней, иначе
+    файл с именем по хэшу, который запишет само поле модели.
+    """
+    try:
+        name = upload_name(digest, inspect_image(file))
+    except ImageError:
+        file.close()
+        raise
+    if default_storage.exists(name):
+        file.close()
+        return name
+    file.name = posixpath.basename(name)
+    return file
+
+
+def store_base64(data):
+    """Картинка из data URL или строки base64."""
+    decoded, digest = decode_base64(data)
+    return store(File(decoded), digest)
+
+
+def store_upload(upload):
+    """Загруженный файл, уже записанный Django в память или на диск."""
+    if upload.size > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ImageError('Картинка слишком большая.')
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    return store(upload, digest.hexdigest())
+
+
+def variant_name(name, variant, fmt):
+    """Путь уменьшенной копии: каталог с именем оригинала рядом с ним."""
+    stem = os.path.splitext(name)[0]
+    return f'{stem}/{variant}.{fmt}'
+
+
+def variant_names(name):
+    return {
+        variant: {fmt: variant_name(name, variant, fmt) for fmt in FORMATS}
+        for variant in VARIANTS
+    }
+
+
+def flatten(image):
+    """Переводит картинку в RGB, подкладывая белый фон под прозрачность."""
+    if image.mode not in ('RGBA', 'LA', 'P'):
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def make_variants(name):
+    """Нарезает уменьшенные копии, уже существующие пропускает."""
+    with default_storage.open(name) as file:
+        with Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for fmt, image_format in FORMATS.items():
+            path = variant_name(name, variant, fmt)
+            if default_storage.exists(path):
+                continue
+            buffer = BytesIO()
+            converted = resized if fmt == 'webp' else flatten(resized)
+            if converted.mode not in ('RGB', 'RGBA'):
+                converted = converted.convert('RGBA')
+            converted.save(
+                buffer, image_format, quality=QUALITY, optimize=True
+            )
+            default_storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def process(recipe_id, name):
+    """Нарезает копии и отмечает рецепт, если картинка не сменилась."""
+    try:
+        make_variants(name)
+        recipe = Recipe.objects.filter(
+            pk=recipe_id, image=name, image_processed=False
+        ).first()
+        if recipe is not None:
+            recipe.image_processed = True
+            recipe.save(update_fields=['image_processed'])
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+
+
+def process_in_worker(recipe_id, name):
+    """Обработка в потоке пула, соединение потока с базой закрывается."""
+    try:
+        process(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    """Пул потоков процесса, после fork воркера создаётся заново."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def schedule(recipe):
+    """Ставит нарезку картинки рецепта в очередь после коммита.
+
+    При RECIPE_IMAGE_WORKERS = 0 картинка обрабатывается сразу
+    в текущем потоке.
+    """
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(process_in_worker, recipe_id, name)
+        else:
+            process(recipe_id, name)
+    transaction.on_commit(submit)
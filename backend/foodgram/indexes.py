@@ -0,0 +1,269 @@
+import abc
+import itertools
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+
+from . import replicas
+
+INGREDIENT_INDEX_VERSION_KEY = 'ingredient_prefix_index_version'
+RECIPE_INGREDIENT_INDEX_VERSION_KEY = 'recipe_ingredient_index_version'
+RECIPE_INGREDIENT_CHANGES_KEY = 'recipe_ingredient_index_changes'
+RECIPE_INGREDIENT_CHANGE_KEY = 'recipe_ingredient_index_change:{}'
+RECIPE_INGREDIENT_MAX_CHANGES = 1000
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска без учёта регистра и «ё»."""
+    return value.casefold().replace('ё', 'е')
+
+
+def scan_prefix(keys, prefix):
+    """Идёт по отсортированному списку пар (ключ, id) с данным префиксом."""
+    position = bisect_left(keys, (prefix,))
+    while position < len(keys) and keys[position][0].startswith(prefix):
+        yield keys[position]
+        position += 1
+
+
+class VersionedIndex(abc.ABC):
+    """Индекс в памяти процесса с версией в общем кэше.
+
+    Загружается лениво при первом обращении. Версия индекса хранится
+    в кэше Django: изменения данных меняют её после коммита, и каждый
+    процесс перестраивает индекс при следующем обращении. Другие
+    процессы видят новую версию, только если кэш у них общий, поэтому
+    индекс старше INDEX_MAX_AGE секунд перестраивается и без неё.
+    """
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded = 0
+
+    def invalidate(self):
+        def bump():
+            replicas.pin()
+            cache.set(self.version_key, uuid.uuid4().hex, None)
+        transaction.on_commit(bump)
+
+    @abc.abstractmethod
+    def load(self, version):
+        """Строит индекс заново и запоминает его версию."""
+
+    def is_current(self, version):
+        max_age = settings.INDEX_MAX_AGE
+        return version == self._version and (
+            not max_age or time.monotonic() - self._loaded < max_age
+        )
+
+    def ensure_loaded(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(self.version_key, version, None)
+            version = cache.get(self.version_key, version)
+        if not self.is_current(version):
+            with self._lock:
+                if not self.is_current(version):
+                    self.load(version)
+                    self._loaded = time.monotonic()
+
+
+class IngredientPrefixIndex(VersionedIndex):
+    """Индекс префиксов названий ингредиентов в памяти процесса."""
+    version_key = INGREDIENT_INDEX_VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._names = []
+        self._words = []
+        self._keys = {}
+
+    def load(self, version):
+        from foodgram.models import Ingredient
+        names = []
+        words = []
+        for pk, name in Ingredient.objects.values_list('pk', 'name'):
+            name = normalize(name)
+            names.append((name, pk))
+            words.extend((word, pk) for word in name.split()[1:])
+        names.sort()
+        words.sort()
+        self._names, self._words, self._keys = names, words, dict(
+            (pk, name) for name, pk in names
+        )
+        self._version = version
+
+    def search(self, prefix, limit=None):
+        """id ингредиентов по префиксу, сначала совпадения с начала
+        названия, затем с начала любого другого слова."""
+        prefix = normalize(prefix.strip())
+        if not prefix:
+            return []
+        self.ensure_loaded()
+        names, words, keys = self._names, self._words, self._keys
+        found = []
+        seen = set()
+        for _, pk in scan_prefix(names, prefix):
+            found.append(pk)
+            seen.add(pk)
+            if limit is not None and len(found) >= limit:
+                return found
+        word_matches = {pk for _, pk in scan_prefix(words, prefix)} - seen
+        found.extend(sorted(word_matches, key=lambda pk: (keys[pk], pk)))
+        return found if limit is None else found[:limit]
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """Инвертированный индекс: ингредиент -> отсортированные id рецептов.
+
+    Подбор рецептов по набору ингредиентов проходит один раз по спискам
+    запрошенных ингредиентов, а не соединяет таблицы для каждого из них.
+
+    Изменение состава рецепта не перестраивает индекс: после коммита id
+    рецепта пишется в журнал в кэше под очередным номером, и процессы при
+    следующем обращении перечитывают из основной базы строки только этих
+    рецептов. Если записей журнала не хватает (вытеснены из кэша или их
+    больше RECIPE_INGREDIENT_MAX_CHANGES), индекс загружается целиком.
+    """
+    version_key = RECIPE_INGREDIENT_INDEX_VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._sequence = 0
+        # Ингредиент -> рецепты, число ингредиентов рецепта и
+        # рецепт -> ингредиенты; меняются вместе одним присваиванием.
+        self._data = ({}, array('H'), {})
+
+    def load(self, version):
+        from foodgram.models import RecipeIngredient
+        sequence = cache.get(RECIPE_INGREDIENT_CHANGES_KEY, 0)
+        recipes = defaultdict(lambda: array('I'))
+        ingredients = defaultdict(list)
+        rows = RecipeIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows.iterator(chunk_size=10000):
+            recipes[ingredient_id].append(recipe_id)
+            ingredients[recipe_id].append(ingredient_id)
+        sizes = array(
+            'H', itertools.repeat(0, max(ingredients, default=0) + 1)
+        )
+        for recipe_id, recipe_ingredients in ingredients.items():
+            sizes[recipe_id] = len(recipe_ingredients)
+        self._data = (dict(recipes), sizes, {
+            recipe_id: tuple(recipe_ingredients)
+            for recipe_id, recipe_ingredients in ingredients.items()
+        })
+        self._sequence = sequence
+        self._version = version
+
+    def changed(self, recipe_ids):
+        """Записывает в журнал изменение состава рецептов после коммита."""
+        recipe_ids = list(recipe_ids)
+
+        def record():
+            cache.add(RECIPE_INGREDIENT_CHANGES_KEY, 0, None)
+            try:
+                sequence = cache.incr(RECIPE_INGREDIENT_CHANGES_KEY)
+            except ValueError:
+                sequence = 1
+                cache.set(RECIPE_INGREDIENT_CHANGES_KEY, sequence, None)
+            cache.set(
+                RECIPE_INGREDIENT_CHANGE_KEY.format(sequence), recipe_ids,
+                settings.INDEX_MAX_AGE or None
+            )
+        transaction.on_commit(record)
+
+    def ensure_loaded(self):
+        super().ensure_loaded()
+        sequence = cache.get(RECIPE_INGREDIENT_CHANGES_KEY, 0)
+        if sequence != self._sequence:
+            with self._lock:
+                if sequence != self._sequence:
+                    self.apply_changes(sequence)
+
+    def apply_changes(self, sequence):
+        numbers = range(self._sequence + 1, sequence + 1)
+        changes = {}
+        if len(numbers) <= RECIPE_INGREDIENT_MAX_CHANGES:
+            changes = cache.get_many([
+                RECIPE_INGREDIENT_CHANGE_KEY.format(number)
+                for number in numbers
+            ])
+        if not numbers or len(changes) < len(numbers):
+            self.load(self._version)
+            self._loaded = time.monotonic()
+            return
+        self.update(set(itertools.chain.from_iterable(changes.values())))
+        self._sequence = sequence
+
+    def update(self, recipe_ids):
+        """Перечитывает из основной базы ингредиенты рецептов recipe_ids."""
+        from foodgram.models import RecipeIngredient
+        current = defaultdict(set)
+        rows = RecipeIngredient.objects.using(
+            router.db_for_write(RecipeIngredient)
+        ).filter(recipe_id__in=recipe_ids).values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        for recipe_id, ingredient_id in rows:
+            current[recipe_id].add(ingredient_id)
+        recipes, sizes, ingredients = self._data
+        sizes = array('H', sizes)
+        sizes.extend(itertools.repeat(0, max(
+            0, max(recipe_ids, default=0) + 1 - len(sizes)
+        )))
+        ingredients = dict(ingredients)
+        postings = {}
+
+        def posting(ingredient_id):
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array(
+                    'I', recipes.get(ingredient_id, ())
+                )
+            return postings[ingredient_id]
+
+        for recipe_id in recipe_ids:
+            old = set(ingredients.pop(recipe_id, ()))
+            new = current[recipe_id]
+            for ingredient_id in old - new:
+                posting(ingredient_id).remove(recipe_id)
+            for ingredient_id in new - old:
+                insort(posting(ingredient_id), recipe_id)
+            if new:
+                ingredients[recipe_id] = tuple(new)
+            sizes[recipe_id] = len(new)
+        self._data = ({**recipes, **postings}, sizes, ingredients)
+
+    def match(self, ingredient_ids, missing_max=0, limit=None):
+        """Рецепты, которым не хватает не больше missing_max ингредиентов.
+
+        Возвращает тройки (id рецепта, доля имеющихся ингредиентов,
+        сколько не хватает), лучшие совпадения первыми.
+        """
+        self.ensure_loaded()
+        recipes, sizes, _ = self._data
+        hits = Counter()
+        for ingredient_id in set(ingredient_ids):
+            hits.update(recipes.get(ingredient_id, ()))
+        found = [
+            (recipe_id, count / sizes[recipe_id], sizes[recipe_id] - count)
+            for recipe_id, count in hits.items()
+            if sizes[recipe_id] - count <= missing_max
+        ]
+        found.sort(key=lambda item: (-item[1], item[2], -item[0]))
+        return found if limit is None else found[:limit]
+
+
+ingredient_index = IngredientPrefixIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import islice
+
+from api.cache import invalidate
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from foodgram.indexes import ingredient_index
+from foodgram.models import Ingredient
+
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+JSON_READ_SIZE = 64 * 1024
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield row[0] if row else '', row[1] if len(row) > 1 else ''
+
+
+def read_json(file):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    position = 1
+    eof = False
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Файл JSON оборван или повреждён.')
+            chunk = file.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Разобрать файл и посчитать строки, ничего не записывая.'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить с места, сохранённого прерванной загрузкой.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Укажите формат файла: --format csv|json.')
+        progress_path = f'{path}.progress'
+        offset = 0
+        if options['resume'] and os.path.exists(progress_path):
+            with open(progress_path) as progress:
+                offset = int(progress.read() or 0)
+        reader = read_csv if file_format == 'csv' else read_json
+        write_chunk = (
+            self.copy_chunk if connection.vendor == 'postgresql'
+            else self.bulk_create_chunk
+        )
+        total_before = Ingredient.objects.count()
+        processed = skipped = 0
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = islice(reader(file), offset, None)
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                processed += len(chunk)
+                ingredients = self.clean_chunk(chunk)
+                skipped += len(chunk) - len(ingredients)
+                if not options['dry_run']:
+                    with transaction.atomic():
+                        write_chunk(ingredients)
+                    with open(progress_path, 'w') as progress:
+                        progress.write(str(offset + processed))
+        elapsed = max(time.monotonic() - started, 1e-9)
+        if options['dry_run']:
+            self.stdout.write(
+                f'Разобрано строк: {processed}, пропущено бы: {skipped}, '
+                f'{processed / elapsed:.0f} строк/с.'
+            )
+            return
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        ingredient_index.invalidate()
+        invalidate('ingredients')
+        created = Ingredient.objects.count() - total_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {created}, '
+            f'пропущено некорректных: {skipped}, '
+            f'{processed / elapsed:.0f} строк/с.'
+        ))
+
+    @staticmethod
+    def clean_chunk(chunk):
+        """Убирает пустые, слишком длинные и повторяющиеся строки."""
+        max_name = Ingredient._meta.get_field('name').max_length
+        max_unit = Ingredient._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        ingredients = {}
+        for name, measurement_unit in chunk:
+            name = str(name).strip()
+            measurement_unit = str(measurement_unit).strip()
+            if (
+                name and measurement_unit
+                and len(name) <= max_name
+                and len(measurement_unit) <= max_unit
+            ):
+                ingredients[name, measurement_unit] = None
+        return list(ingredients)
+
+    @staticmethod
+    def copy_chunk(ingredients):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(ingredients)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+
+    @staticmethod
+    def bulk_create_chunk(ingredients):
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in ingredients),
+            ignore_conflicts=True
+        )
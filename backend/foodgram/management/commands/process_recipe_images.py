@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from foodgram.images import process
+from foodgram.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Нарезает уменьшенные копии картинок рецептов, где их ещё нет.'
+
+    def handle(self, *args, **options):
+        recipes = list(Recipe.objects.filter(
+            image_processed=False
+        ).order_by('pk').values_list('pk', 'image'))
+        for recipe_id, name in recipes:
+            process(recipe_id, name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинки обработаны, рецептов: {len(recipes)}.'
+        ))
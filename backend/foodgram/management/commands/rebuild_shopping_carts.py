@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from foodgram.models import ShoppingCartIngredient, ShoppingList
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает или сверяет агрегат ингредиентов корзин.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить агрегат с корзинами, ничего не меняя.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько пользователей обрабатывать за раз.'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingList.objects.values_list('user_id', flat=True))
+            | set(ShoppingCartIngredient.objects.values_list(
+                'user_id', flat=True
+            ))
+        )
+        batch_size = options['batch_size']
+        mismatched = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            if options['verify']:
+                mismatched += self.verify(batch)
+            else:
+                ShoppingCartIngredient.objects.rebuild(batch)
+        if options['verify']:
+            if mismatched:
+                raise CommandError(
+                    f'Агрегат расходится с корзинами у {mismatched} '
+                    f'из {len(user_ids)} пользователей.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'Агрегат совпадает с корзинами, '
+                f'пользователей: {len(user_ids)}.'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Агрегат пересобран, пользователей: {len(user_ids)}.'
+        ))
+
+    def verify(self, user_ids):
+        expected = set(
+            ShoppingCartIngredient.objects.aggregate_from_carts(user_ids)
+        )
+        actual = set(ShoppingCartIngredient.objects.filter(
+            user_id__in=user_ids
+        ).values_list('user_id', 'ingredient_id', 'amount'))
+        return len({row[0] for row in expected ^ actual})
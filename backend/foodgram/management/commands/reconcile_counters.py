@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from foodgram.models import Favorite, Recipe, ShoppingList
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def count_of(model, field):
+    """Подзапрос с фактическим числом связанных строк."""
+    return Coalesce(models.Subquery(
+        model.objects.filter(
+            **{field: models.OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=models.Count('pk')
+        ).values('total'),
+        output_field=models.IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики рецептов и пользователей, исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сверить счётчики, ничего не меняя.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк обрабатывать за раз.'
+        )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for model, field, related_model, related_field in COUNTERS:
+            count = self.reconcile(
+                model, field, count_of(related_model, related_field),
+                options['batch_size'], options['verify']
+            )
+            if count:
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: '
+                    f'расхождений {count}.'
+                )
+            drifted += count
+        if options['verify']:
+            if drifted:
+                raise CommandError(
+                    f'Счётчики расходятся в {drifted} строках.'
+                )
+            self.stdout.write(self.style.SUCCESS('Счётчики совпадают.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики сверены, исправлено строк: {drifted}.'
+        ))
+
+    def reconcile(self, model, field, actual, batch_size, verify):
+        """Исправляет счётчик пачками по диапазонам первичного ключа."""
+        ids = model.objects.order_by('pk').values_list('pk', flat=True)
+        drifted = 0
+        last_id = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                return drifted
+            last_id = batch[-1]
+            wrong = model.objects.filter(
+                pk__gte=batch[0], pk__lte=last_id
+            ).annotate(actual=actual).exclude(**{field: models.F('actual')})
+            wrong_ids = list(wrong.values_list('pk', flat=True))
+            drifted += len(wrong_ids)
+            if wrong_ids and not verify:
+                with transaction.atomic():
+                    model.objects.filter(
+                        pk__in=wrong_ids
+                    ).update(**{field: actual})
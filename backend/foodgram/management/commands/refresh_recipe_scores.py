@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from foodgram.models import Recipe, RecipeScore
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает оценки популярности рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать оценки всех рецептов, а не только устаревшие.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько рецептов пересчитывать за раз.'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = RecipeScore.objects.aggregate(since=Max('updated'))['since']
+        if options['full'] or since is None:
+            recipe_ids = Recipe.objects.values_list('id', flat=True)
+        else:
+            recipe_ids = RecipeScore.objects.stale_recipe_ids(since)
+        recipe_ids = sorted(recipe_ids)
+        batch_size = options['batch_size']
+        for start in range(0, len(recipe_ids), batch_size):
+            RecipeScore.objects.refresh(
+                recipe_ids[start:start + batch_size], now
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки пересчитаны, рецептов: {len(recipe_ids)}.'
+        ))
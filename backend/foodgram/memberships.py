@@ -0,0 +1,358 @@
+"""Избранное, корзина и подписки: добавление и удаление одним запросом.
+
+Строка связи вставляется через INSERT ... ON CONFLICT DO NOTHING или
+удаляется, и в том же обращении к базе меняется счётчик цели, а её
+строка возвращается для ответа. В PostgreSQL это один оператор с CTE,
+в SQLite - два оператора с RETURNING в одной транзакции. Повторное
+добавление или удаление ничего не меняет, поэтому двойной клик не
+приводит к IntegrityError и не сбивает счётчики.
+
+Для флагов is_favorited, is_in_shopping_cart и is_subscribed множества
+id избранного, корзины и подписок пользователя читаются одним запросом.
+С общим кэшем (CACHE_SHARED) они хранятся в нём между запросами: любое
+изменение связей пользователя меняет номер поколения, и записи прежних
+поколений больше не читаются. Кэш в памяти процесса другие воркеры не
+видят, поэтому с ним множества читаются заново в каждом запросе.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import IntegerField, Value
+from django.utils import timezone
+from users.models import Subscription
+
+from . import replicas
+from .models import Favorite, ShoppingList, increment
+
+
+class Membership:
+    """Связь пользователя с целью и счётчик связей у цели.
+
+    columns - поля цели, которые возвращаются вместе с изменением
+    счётчика и из которых собирается объект для ответа.
+    """
+
+    def __init__(self, model, target, counter, columns, kind):
+        self.model = model
+        self.kind = kind
+        self.target = model._meta.get_field(target)
+        self.target_model = self.target.related_model
+        self.counter = counter
+        self.fields = [
+            field for field in self.target_model._meta.concrete_fields
+            if field.attname in columns
+        ]
+        self.timestamped = any(
+            field.name == 'created' for field in model._meta.fields
+        )
+
+    def names(self, connection):
+        quote = connection.ops.quote_name
+        targets = quote(self.target_model._meta.db_table)
+        created = ''
+        if self.timestamped:
+            column = self.model._meta.get_field('created').column
+            created = f', {quote(column)}'
+        return {
+            'table': quote(self.model._meta.db_table),
+            'user': quote(self.model._meta.get_field('user').column),
+            'target': quote(self.target.column),
+            'targets': targets,
+            'pk': quote(self.target_model._meta.pk.column),
+            'counter': quote(self.counter),
+            'columns': ', '.join(
+                quote(field.column) for field in self.fields
+            ),
+            'qualified': ', '.join(
+                f'{targets}.{quote(field.column)}' for field in self.fields
+            ),
+            'created': created,
+            'now': ', %s' if self.timestamped else '',
+        }
+
+    def insert_params(self, connection, user_id):
+        if not self.timestamped:
+            return [user_id]
+        return [
+            user_id,
+            connection.ops.adapt_datetimefield_value(timezone.now())
+        ]
+
+    def instances(self, using, rows):
+        names = [field.attname for field in self.fields]
+        return [self.target_model.from_db(using, names, row) for row in rows]
+
+
+FAVORITES = Membership(
+    Favorite, 'recipe', 'favorites_count',
+    ('id', 'name', 'image', 'cooking_time'), 0
+)
+CART = Membership(
+    ShoppingList, 'recipe', 'cart_count',
+    ('id', 'name', 'image', 'cooking_time'), 1
+)
+SUBSCRIPTIONS = Membership(
+    Subscription, 'author', 'followers_count',
+    ('id', 'email', 'username', 'first_name', 'last_name',
+     'recipes_count', 'followers_count'), 2
+)
+MEMBERSHIPS = (FAVORITES, CART, SUBSCRIPTIONS)
+
+State = namedtuple('State', ('favorites', 'cart', 'following'))
+EMPTY_STATE = State(frozenset(), frozenset(), frozenset())
+STATE_KEY = 'memberships:state:{}'
+GENERATION_KEY = 'memberships:generation:{}'
+
+
+class PostgresMemberships:
+    add_sql = """
+        WITH added AS (
+            INSERT INTO {table} ({user}, {target}{created})
+            SELECT %s, {pk}{now} FROM {targets} WHERE {pk} = ANY(%s)
+            ON CONFLICT DO NOTHING
+            RETURNING {target}
+        )
+        UPDATE {targets} SET {counter} = {counter} + 1
+        FROM added WHERE {targets}.{pk} = added.{target}
+        RETURNING {qualified}
+    """
+    remove_sql = """
+        WITH removed AS (
+            DELETE FROM {table} WHERE {user} = %s AND {target} = ANY(%s)
+            RETURNING {target}
+        )
+        UPDATE {targets} SET {counter} = GREATEST({counter} - 1, 0)
+        FROM removed WHERE {targets}.{pk} = removed.{target}
+        RETURNING {targets}.{pk}
+    """
+
+    def add(self, membership, connection, user_id, target_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self.add_sql.format(**membership.names(connection)),
+                [*membership.insert_params(connection, user_id),
+                 list(target_ids)]
+            )
+            return cursor.fetchall()
+
+    def remove(self, membership, connection, user_id, target_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self.remove_sql.format(**membership.names(connection)),
+                [user_id, list(target_ids)]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteMemberships:
+    """SQLite 3.35+: RETURNING есть, изменяющих CTE нет."""
+    add_sql = """
+        INSERT INTO {table} ({user}, {target}{created})
+        SELECT %s, {pk}{now} FROM {targets} WHERE {pk} IN ({ids})
+        ON CONFLICT DO NOTHING
+        RETURNING {target}
+    """
+    remove_sql = """
+        DELETE FROM {table} WHERE {user} = %s AND {target} IN ({ids})
+        RETURNING {target}
+    """
+    increment_sql = """
+        UPDATE {targets} SET {counter} = {counter} + 1
+        WHERE {pk} IN ({ids})
+        RETURNING {columns}
+    """
+    decrement_sql = """
+        UPDATE {targets} SET {counter} = MAX({counter} - 1, 0)
+        WHERE {pk} IN ({ids})
+    """
+
+    @staticmethod
+    def execute(cursor, sql, names, params, target_ids):
+        ids = ', '.join('%s' for _ in target_ids)
+        cursor.execute(
+            sql.format(**names, ids=ids), [*params, *target_ids]
+        )
+
+    def add(self, membership, connection, user_id, target_ids):
+        names = membership.names(connection)
+        with transaction.atomic(using=connection.alias, savepoint=False), \
+                connection.cursor() as cursor:
+            self.execute(
+                cursor, self.add_sql, names,
+                membership.insert_params(connection, user_id), target_ids
+            )
+            added = [row[0] for row in cursor.fetchall()]
+            if not added:
+                return []
+            self.execute(cursor, self.increment_sql, names, (), added)
+            return cursor.fetchall()
+
+    def remove(self, membership, connection, user_id, target_ids):
+        names = membership.names(connection)
+        with transaction.atomic(using=connection.alias, savepoint=False), \
+                connection.cursor() as cursor:
+            self.execute(
+                cursor, self.remove_sql, names, (user_id,), target_ids
+            )
+            removed = [row[0] for row in cursor.fetchall()]
+            if removed:
+                self.execute(cursor, self.decrement_sql, names, (), removed)
+            return removed
+
+
+class FallbackMemberships:
+    """Через ORM: каждая вставка в своей точке сохранения."""
+
+    def add(self, membership, connection, user_id, target_ids):
+        using = connection.alias
+        targets = membership.target_model._default_manager.db_manager(using)
+        added = []
+        with transaction.atomic(using=using):
+            for target_id in targets.filter(
+                pk__in=target_ids
+            ).values_list('pk', flat=True):
+                try:
+                    with transaction.atomic(using=using):
+                        membership.model._default_manager.db_manager(
+                            using
+                        ).create(**{
+                            'user_id': user_id,
+                            membership.target.attname: target_id,
+                        })
+                except IntegrityError:
+                    continue
+                added.append(target_id)
+            rows = targets.filter(pk__in=added)
+            increment(rows, membership.counter)
+            return list(rows.values_list(
+                *(field.attname for field in membership.fields)
+            ))
+
+    def remove(self, membership, connection, user_id, target_ids):
+        using = connection.alias
+        with transaction.atomic(using=using):
+            links = membership.model._default_manager.db_manager(
+                using
+            ).select_for_update().filter(**{
+                'user_id': user_id,
+                f'{membership.target.attname}__in': target_ids,
+            })
+            removed = list(links.values_list(
+                membership.target.attname, flat=True
+            ))
+            links.delete()
+            increment(
+                membership.target_model._default_manager.db_manager(
+                    using
+                ).filter(pk__in=removed),
+                membership.counter, -1
+            )
+            return removed
+
+
+def get_backend(connection):
+    if connection.vendor == 'postgresql':
+        return PostgresMemberships()
+    if (connection.vendor == 'sqlite'
+            and connection.Database.sqlite_version_info >= (3, 35)):
+        return SQLiteMemberships()
+    return FallbackMemberships()
+
+
+def add(membership, user, target_ids):
+    """Добавляет связи, которых ещё нет, и увеличивает счётчики целей.
+
+    Возвращает добавленные цели в порядке target_ids, с полями
+    membership.columns и уже изменённым счётчиком. Несуществующие цели
+    пропускаются.
+    """
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return []
+    using = router.db_for_write(membership.model)
+    connection = connections[using]
+    rows = get_backend(connection).add(
+        membership, connection, user.pk, target_ids
+    )
+    if rows:
+        user.__dict__.pop('_membership_state', None)
+        forget(user.pk)
+    order = {target_id: index for index, target_id in enumerate(target_ids)}
+    return sorted(
+        membership.instances(using, rows), key=lambda obj: order[obj.pk]
+    )
+
+
+def remove(membership, user, target_ids):
+    """Удаляет существующие связи, возвращает id затронутых целей."""
+    target_ids = list(dict.fromkeys(target_ids))
+    if not target_ids:
+        return []
+    connection = connections[router.db_for_write(membership.model)]
+    removed = get_backend(connection).remove(
+        membership, connection, user.pk, target_ids
+    )
+    if removed:
+        user.__dict__.pop('_membership_state', None)
+        forget(user.pk)
+    return removed
+
+
+def load_state(user_id):
+    """Читает id избранного, корзины и подписок одним запросом."""
+    queries = [
+        membership.model.objects.filter(user_id=user_id).annotate(
+            kind=Value(membership.kind, output_field=IntegerField())
+        ).values_list(membership.target.attname, 'kind')
+        for membership in MEMBERSHIPS
+    ]
+    ids = tuple(set() for _ in MEMBERSHIPS)
+    for target_id, kind in queries[0].union(*queries[1:], all=True):
+        ids[kind].add(target_id)
+    return State(*map(frozenset, ids))
+
+
+def get_state(user):
+    """Множества связей пользователя, одни на запрос.
+
+    Запись в кэше годится, только пока не сменилось поколение: так
+    состояние, прочитанное до чужого изменения, не переживёт его.
+    """
+    if not user.is_authenticated:
+        return EMPTY_STATE
+    state = getattr(user, '_membership_state', None)
+    if state is not None:
+        return state
+    if not settings.CACHE_SHARED:
+        user._membership_state = load_state(user.pk)
+        return user._membership_state
+    generation_key = GENERATION_KEY.format(user.pk)
+    state_key = STATE_KEY.format(user.pk)
+    cached = cache.get_many([generation_key, state_key])
+    generation = cached.get(generation_key)
+    entry = cached.get(state_key)
+    if entry is not None and entry[0] == generation:
+        state = entry[1]
+    else:
+        state = load_state(user.pk)
+        cache.set(
+            state_key, (generation, state), settings.MEMBERSHIP_CACHE_TIMEOUT
+        )
+    user._membership_state = state
+    return state
+
+
+def forget(user_id):
+    """Сбрасывает состояние связей пользователя после коммита."""
+    key = GENERATION_KEY.format(user_id)
+
+    def bump():
+        replicas.pin(user_id)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+    transaction.on_commit(bump)
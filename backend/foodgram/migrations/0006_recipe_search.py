@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:20
+
+from django.db import migrations
+
+from foodgram import search
+
+
+def install_search(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0005_recipescore'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
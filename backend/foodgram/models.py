@@ -1,8 +1,18 @@
+import math
+from datetime import datetime
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from users.models import Subscription
 
 User = get_user_model()
 
+POPULAR_AUTHORS_KEY = 'feed:popular_authors'
+SCORE_EPOCH = datetime(2021, 1, 1)
+
 
 class Tag(models.Model):
     """Модель тэгов."""
@@ -42,6 +52,52 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов с предзагрузкой связанных данных."""
+
+    @staticmethod
+    def related_lookups():
+        return (
+            'tags',
+            models.Prefetch(
+                'recipeingredient',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def with_related(self):
+        """Подгружает тэги и ингредиенты фиксированным числом запросов."""
+        return self.prefetch_related(*self.related_lookups())
+
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Рецепты обычных авторов читаются из ленты пользователя, заполненной
+        при публикации. Рецепты авторов с числом подписчиков больше
+        FEED_FANOUT_LIMIT в ленты не раскладываются и выбираются напрямую.
+        """
+        return self.filter(
+            models.Q(id__in=FeedEntry.objects.filter(
+                user=user
+            ).values('recipe_id'))
+            | models.Q(author_id__in=Subscription.objects.filter(
+                user=user,
+                author_id__in=popular_author_ids()
+            ).values('author_id'))
+        )
+
+
+def popular_author_ids():
+    """id авторов, рецепты которых не раскладываются по лентам."""
+    return cache.get_or_set(
+        POPULAR_AUTHORS_KEY,
+        lambda: list(User.objects.filter(
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('id', flat=True)),
+        settings.FEED_POPULAR_AUTHORS_TIMEOUT
+    )
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     name = models.CharField(
@@ -64,6 +120,10 @@ class Recipe(models.Model):
         db_index=True
     )
     image = models.ImageField('Картинка', upload_to='recipe/',)
+    image_processed = models.BooleanField(
+        'Уменьшенные копии картинки готовы',
+        default=False,
+    )
     text = models.TextField('Описание')
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления (в минутах)',
@@ -74,6 +134,18 @@ class Recipe(models.Model):
         through='RecipeIngredient',
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлено в избранное, раз',
+        default=0,
+        db_index=True,
+    )
+    cart_count = models.PositiveIntegerField(
+        'Добавлено в корзину, раз',
+        default=0,
+        db_index=True,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
@@ -84,6 +156,11 @@ class Recipe(models.Model):
         return self.name
 
 
+def increment(queryset, field, delta=1):
+    """Атомарно изменяет счётчик, не опуская его ниже нуля."""
+    return queryset.update(**{field: Greatest(models.F(field) + delta, 0)})
+
+
 class RecipeIngredient(models.Model):
     """Модель для связи рецептов с ингредиентами, вспомогательная."""
     recipe = models.ForeignKey(
@@ -129,6 +206,11 @@ class ShoppingList(models.Model):
         null=True,
         related_name='shoppinglist',
     )
+    created = models.DateTimeField(
+        'Добавлено',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         constraints = [
@@ -156,6 +238,11 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='favorite'
     )
+    created = models.DateTimeField(
+        'Добавлено',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         constraints = [
@@ -169,3 +256,322 @@ class Favorite(models.Model):
 
     def __str__(self):
         return self.user.username
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Инкрементальное обновление агрегата корзин."""
+
+    def apply(self, user_ids, amounts):
+        """Прибавляет к корзинам пользователей количества ингредиентов.
+
+        amounts - словарь {id ингредиента: изменение количества}, изменения
+        могут быть отрицательными. Обнулившиеся строки удаляются.
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                (self.model(user_id=user_id, ingredient_id=ingredient_id)
+                 for user_id in user_ids
+                 for ingredient_id, amount in amounts.items() if amount > 0),
+                ignore_conflicts=True
+            )
+            delta = models.Case(
+                *(models.When(ingredient_id=ingredient_id, then=amount)
+                  for ingredient_id, amount in amounts.items()),
+                default=0,
+                output_field=models.IntegerField()
+            )
+            carts = self.filter(user_id__in=user_ids)
+            carts.filter(ingredient_id__in=amounts).update(
+                amount=Greatest(models.F('amount') + delta, 0)
+            )
+            carts.filter(amount=0).delete()
+
+    def add_recipes(self, user, recipe_ids):
+        self.apply((user.id,), recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        self.apply((user.id,), {
+            ingredient_id: -amount
+            for ingredient_id, amount in recipes_amounts(recipe_ids).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в корзины с этим рецептом."""
+        user_ids = ShoppingList.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+        self.apply(user_ids, {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        })
+
+    def aggregate_from_carts(self, user_ids=None):
+        """Считает агрегат заново по корзинам пользователей.
+
+        Условия на корзину задаются одним filter(): второй вызов по
+        многозначной связи добавил бы ещё одно соединение с корзинами,
+        и суммы умножились бы на число корзин с рецептом.
+        """
+        carts = {'recipe__shoppinglist__isnull': False}
+        if user_ids is not None:
+            carts['recipe__shoppinglist__user_id__in'] = user_ids
+        return RecipeIngredient.objects.filter(**carts).values_list(
+            'recipe__shoppinglist__user_id', 'ingredient_id'
+        ).annotate(total=models.Sum('amount')).order_by()
+
+    def rebuild(self, user_ids):
+        """Пересобирает агрегат корзин указанных пользователей."""
+        with transaction.atomic():
+            self.filter(user_id__in=user_ids).delete()
+            self.bulk_create(
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=total
+                )
+                for user_id, ingredient_id, total
+                in self.aggregate_from_carts(user_ids)
+            )
+
+
+def recipe_amounts(recipe):
+    """Словарь {id ингредиента: количество} для рецепта."""
+    return dict(recipe.recipeingredient.values_list('ingredient_id', 'amount'))
+
+
+def recipes_amounts(recipe_ids):
+    """Суммарные количества ингредиентов нескольких рецептов."""
+    if not recipe_ids:
+        return {}
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(
+        total=models.Sum('amount')
+    ).order_by().values_list('ingredient_id', 'total'))
+
+
+class ShoppingCartIngredient(models.Model):
+    """Модель суммарных ингредиентов корзины, вспомогательная."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+    )
+    amount = models.PositiveIntegerField('Количество', default=0)
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient',
+            ),
+        ]
+        verbose_name = 'Ингредиент корзины'
+        verbose_name_plural = 'Ингредиенты корзин'
+
+    def __str__(self):
+        return self.user.username
+
+
+class FeedEntryManager(models.Manager):
+    """Раскладка рецептов по лентам подписчиков."""
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора."""
+        if recipe.author.followers_count > settings.FEED_FANOUT_LIMIT:
+            if recipe.author_id not in popular_author_ids():
+                cache.delete(POPULAR_AUTHORS_KEY)
+            return
+        followers = Subscription.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True)
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe=recipe)
+             for user_id in followers),
+            ignore_conflicts=True
+        )
+
+    def backfill(self, user, author):
+        """Добавляет в ленту последние рецепты нового автора подписок."""
+        if author.followers_count > settings.FEED_FANOUT_LIMIT:
+            return
+        recipe_ids = author.recipes.values_list(
+            'id', flat=True
+        )[:settings.FEED_BACKFILL_SIZE]
+        self.bulk_create(
+            (self.model(user=user, recipe_id=recipe_id)
+             for recipe_id in recipe_ids),
+            ignore_conflicts=True
+        )
+
+    def remove_author(self, user, author):
+        self.filter(user=user, recipe__author=author).delete()
+
+
+class FeedEntry(models.Model):
+    """Модель ленты рецептов подписок, вспомогательная."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry',
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+
+    def __str__(self):
+        return self.user.username
+
+
+def decayed_score(events, half_life):
+    """Логарифм затухающей суммы весов событий: ln(1 + sum(w * 2^(t/T))).
+
+    Время отсчитывается от SCORE_EPOCH, поэтому оценки рецептов
+    сравнимы между собой без пересчёта при каждом обновлении, а новые
+    события не требуют затухания уже посчитанных. Без событий оценка 0.
+    """
+    seconds = half_life * 24 * 60 * 60
+    exponents = [
+        math.log(weight)
+        + math.log(2) * (
+            created.replace(tzinfo=None) - SCORE_EPOCH
+        ).total_seconds() / seconds
+        for created, weight in events
+    ]
+    top = max([0.0, *exponents])
+    return top + math.log(
+        math.exp(-top) + sum(math.exp(value - top) for value in exponents)
+    )
+
+
+class RecipeScoreManager(models.Manager):
+    """Пересчёт оценок популярности рецептов."""
+
+    def stale_recipe_ids(self, since):
+        """id рецептов, оценки которых устарели с момента since.
+
+        Устаревшими считаются рецепты без оценки, рецепты с новыми
+        добавлениями в избранное или корзину и рецепты, счётчики которых
+        разошлись со снимком в оценке (так учитываются удаления).
+        """
+        recipe_ids = set(Recipe.objects.filter(
+            score__isnull=True
+        ).values_list('id', flat=True))
+        recipe_ids.update(self.exclude(
+            favorites=models.F('recipe__favorites_count'),
+            carts=models.F('recipe__cart_count')
+        ).values_list('recipe_id', flat=True))
+        for model in (Favorite, ShoppingList):
+            recipe_ids.update(model.objects.filter(
+                created__gte=since,
+                recipe__isnull=False
+            ).values_list('recipe_id', flat=True))
+        return recipe_ids
+
+    def refresh(self, recipe_ids, now):
+        """Пересчитывает оценки рецептов по их избранному и корзинам."""
+        counters = Recipe.objects.filter(id__in=recipe_ids).values_list(
+            'id', 'favorites_count', 'cart_count'
+        )
+        events = {recipe_id: [] for recipe_id in recipe_ids}
+        for model, weight in (
+            (Favorite, 1.0),
+            (ShoppingList, settings.RECIPE_SCORE_CART_WEIGHT),
+        ):
+            for recipe_id, created in model.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', 'created').iterator():
+                events[recipe_id].append((created, weight))
+        scores = [
+            self.model(
+                recipe_id=recipe_id,
+                popular=decayed_score(
+                    events[recipe_id],
+                    settings.RECIPE_SCORE_POPULAR_HALF_LIFE
+                ),
+                trending=decayed_score(
+                    events[recipe_id],
+                    settings.RECIPE_SCORE_TRENDING_HALF_LIFE
+                ),
+                favorites=favorites_count,
+                carts=cart_count,
+                updated=now,
+            )
+            for recipe_id, favorites_count, cart_count in counters
+        ]
+        with transaction.atomic():
+            self.filter(recipe_id__in=recipe_ids).delete()
+            self.bulk_create(scores)
+
+
+class RecipeScore(models.Model):
+    """Модель оценок популярности рецептов, вспомогательная."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+    )
+    popular = models.FloatField('Популярность', default=0)
+    trending = models.FloatField('Популярность за последние дни', default=0)
+    favorites = models.PositiveIntegerField(
+        'Снимок счётчика избранного',
+        default=0,
+    )
+    carts = models.PositiveIntegerField(
+        'Снимок счётчика корзин',
+        default=0,
+    )
+    updated = models.DateTimeField('Пересчитано', null=True, db_index=True)
+
+    objects = RecipeScoreManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-popular', '-recipe'],
+                name='recipe_score_popular',
+            ),
+            models.Index(
+                fields=['-trending', '-recipe'],
+                name='recipe_score_trending',
+            ),
+        ]
+        verbose_name = 'Оценка рецепта'
+        verbose_name_plural = 'Оценки рецептов'
+
+    def __str__(self):
+        return self.recipe.name
@@ -0,0 +1,81 @@
+"""Чтение с реплик базы и чтение своих записей с основной базы.
+
+Роутер отправляет чтения на реплику только после activate(alias) или
+внутри use(alias): вьюхи включают реплику для безопасных запросов, всё
+остальное, в том числе любые записи, идёт в основную базу. Реплика
+может отставать, поэтому после записи чтения закрепляются за основной
+базой на DB_REPLICA_PIN_TIMEOUT секунд: пользователь после изменения
+своих связей видит их сразу, а после сброса кэшей ответов, фрагментов
+и индексов на основную базу переходят все, чтобы кэш с новой версией
+не собрался из старых данных.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_KEY = 'db_replicas:pin:{}'
+ALL = 'all'
+
+_replica = ContextVar('replica', default=None)
+
+
+def pin(user_id=ALL):
+    """Закрепляет чтения пользователя или всех за основной базой."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(PIN_KEY.format(user_id), 1, settings.DB_REPLICA_PIN_TIMEOUT)
+
+
+def choose(user):
+    """Реплика для чтений пользователя или None, если читать с основной."""
+    if not settings.DATABASE_REPLICAS:
+        return None
+    keys = [PIN_KEY.format(ALL)]
+    if user.is_authenticated:
+        keys.append(PIN_KEY.format(user.pk))
+    if cache.get_many(keys):
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def activate(alias):
+    """Направляет чтения в базу alias до deactivate(token)."""
+    return _replica.set(alias)
+
+
+def deactivate(token):
+    _replica.reset(token)
+
+
+@contextmanager
+def use(alias):
+    """Чтения внутри блока идут в базу alias."""
+    token = activate(alias)
+    try:
+        yield
+    finally:
+        deactivate(token)
+
+
+class ReplicaRouter:
+    """Чтения после activate() - на выбранную реплику, записи - в default."""
+
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,261 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+Поисковые структуры создаются сырым SQL и моделям не видны:
+в PostgreSQL это колонка tsvector с GIN-индексом, которую заполняет
+триггер, в SQLite - внешняя таблица FTS5 с триггерами синхронизации.
+Для остальных баз поиск сводится к icontains без ранжирования.
+"""
+import html
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'pg_catalog.russian'
+SNIPPET_START = '\x02'
+SNIPPET_STOP = '\x03'
+SNIPPET_WORDS = 16
+FTS_TABLE = 'foodgram_recipe_fts'
+
+POSTGRES_INSTALL = (
+    'ALTER TABLE foodgram_recipe ADD COLUMN search_vector tsvector',
+    f"""
+    CREATE FUNCTION foodgram_recipe_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('{SEARCH_CONFIG}',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER foodgram_recipe_search_vector
+    BEFORE INSERT OR UPDATE OF name, text ON foodgram_recipe
+    FOR EACH ROW EXECUTE PROCEDURE foodgram_recipe_search_vector()
+    """,
+    'UPDATE foodgram_recipe SET name = name',
+    """
+    CREATE INDEX foodgram_recipe_search_vector
+    ON foodgram_recipe USING gin (search_vector)
+    """,
+)
+
+POSTGRES_UNINSTALL = (
+    'DROP TRIGGER foodgram_recipe_search_vector ON foodgram_recipe',
+    'DROP FUNCTION foodgram_recipe_search_vector()',
+    'ALTER TABLE foodgram_recipe DROP COLUMN search_vector',
+)
+
+SQLITE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text,
+        content='foodgram_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+
+SQLITE_RANK = (
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) "
+    "VALUES ('rank', 'bm25(10.0, 1.0)')"
+)
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON foodgram_recipe
+        BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    """,
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON foodgram_recipe
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+        END
+    """,
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER {FTS_TABLE}_update
+        AFTER UPDATE OF name, text ON foodgram_recipe
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+            VALUES ('delete', old.id, old.name, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, name, text)
+            VALUES (new.id, new.name, new.text);
+        END
+    """,
+}
+
+
+def install(connection):
+    """Создаёт поисковые структуры для базы connection."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+    elif connection.vendor == 'sqlite':
+        ensure_sqlite_triggers(connection)
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_UNINSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def ensure_sqlite_triggers(connection):
+    """Восстанавливает таблицу FTS5 и триггеры, если их нет.
+
+    SQLite-миграции Django пересоздают таблицу рецептов при изменении
+    схемы и теряют её триггеры, поэтому проверка выполняется после
+    каждого migrate. Если чего-то не хватало, индекс перестраивается.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = 'foodgram_recipe'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [
+            sql for name, sql in SQLITE_TRIGGERS.items()
+            if name not in existing
+        ]
+        if not missing:
+            return
+        cursor.execute(SQLITE_TABLE)
+        cursor.execute(SQLITE_RANK)
+        for sql in missing:
+            cursor.execute(sql)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def fts_query(query):
+    """Запрос FTS5 из пользовательской строки: все слова по префиксу."""
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""'))
+        for word in re.findall(r'\w+', query.lower())
+    )
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и размечает найденные слова тегом mark."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(
+        SNIPPET_START, '<mark>'
+    ).replace(SNIPPET_STOP, '</mark>')
+
+
+class PostgresSearch:
+    tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+
+    def filter(self, queryset, query):
+        return queryset.extra(
+            where=(f'foodgram_recipe.search_vector @@ {self.tsquery}',),
+            params=(query,)
+        ).annotate(search_rank=RawSQL(
+            f'ts_rank_cd(foodgram_recipe.search_vector, {self.tsquery})',
+            (query,),
+            output_field=FloatField()
+        ))
+
+    def snippets(self, connection, recipe_ids, query):
+        options = (
+            f'StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, '
+            f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, ts_headline('{SEARCH_CONFIG}', text, "
+                f'{self.tsquery}, %s) FROM foodgram_recipe '
+                'WHERE id = ANY(%s)',
+                (query, options, list(recipe_ids))
+            )
+            return dict(cursor.fetchall())
+
+
+class SQLiteSearch:
+    match = f'{FTS_TABLE} MATCH %s'
+
+    def filter(self, queryset, query):
+        query = fts_query(query)
+        if not query:
+            return self.empty(queryset)
+        return queryset.extra(
+            tables=(FTS_TABLE,),
+            where=(f'{FTS_TABLE}.rowid = foodgram_recipe.id', self.match),
+            params=(query,)
+        ).annotate(search_rank=RawSQL(
+            f'-{FTS_TABLE}.rank', (), output_field=FloatField()
+        ))
+
+    def empty(self, queryset):
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).none()
+
+    def snippets(self, connection, recipe_ids, query):
+        recipe_ids = list(recipe_ids)
+        placeholders = ', '.join('%s' for _ in recipe_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({FTS_TABLE}, 1, %s, %s, %s, %s) '
+                f'FROM {FTS_TABLE} WHERE {self.match} '
+                f'AND rowid IN ({placeholders})',
+                (SNIPPET_START, SNIPPET_STOP, '…', SNIPPET_WORDS,
+                 fts_query(query), *recipe_ids)
+            )
+            return dict(cursor.fetchall())
+
+
+class FallbackSearch:
+
+    def filter(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def snippets(self, connection, recipe_ids, query):
+        return {}
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch(),
+    'sqlite': SQLiteSearch(),
+}
+
+
+def get_backend(connection):
+    return BACKENDS.get(connection.vendor, FallbackSearch())
+
+
+def search_recipes(queryset, query):
+    """Оставляет найденные рецепты и аннотирует их релевантность."""
+    return get_backend(connections[queryset.db]).filter(queryset, query)
+
+
+def attach_snippets(recipes, query, using='default'):
+    """Добавляет рецептам страницы фрагменты описания с подсветкой.
+
+    Фрагменты считаются отдельным запросом только для рецептов страницы,
+    а не для всех найденных.
+    """
+    if not recipes:
+        return
+    connection = connections[using]
+    snippets = get_backend(connection).snippets(
+        connection, (recipe.id for recipe in recipes), query
+    )
+    for recipe in recipes:
+        recipe.search_snippet = highlight(snippets.get(recipe.id))
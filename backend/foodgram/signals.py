@@ -0,0 +1,51 @@
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from users.models import Subscription
+
+from .indexes import ingredient_index, recipe_ingredient_index
+from .memberships import forget
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     RecipeScore, ShoppingList)
+from .search import ensure_sqlite_triggers
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def update_recipe_ingredient_index(instance, **kwargs):
+    recipe_ingredient_index.changed((instance.recipe_id,))
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(instance, created, using, **kwargs):
+    """Нулевая оценка нового рецепта, откуда бы он ни появился.
+
+    Без строки оценки рецепт не попадает в ?ordering=popular и trending.
+    Строка из фикстуры с тем же рецептом просто перезапишет эту.
+    """
+    if created:
+        RecipeScore.objects.using(using).bulk_create(
+            [RecipeScore(recipe_id=instance.pk)], ignore_conflicts=True
+        )
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Subscription)
+def forget_memberships(instance, **kwargs):
+    forget(instance.user_id)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name != 'foodgram' or connection.vendor != 'sqlite':
+        return
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ('foodgram', '0006_recipe_search') in applied:
+        ensure_sqlite_triggers(connection)
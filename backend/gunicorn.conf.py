@@ -0,0 +1,105 @@
+"""Профиль gunicorn для продакшена.
+
+Число воркеров и потоков подбирается по доступным CPU (с учётом квоты
+cgroup контейнера) и памяти, любое значение можно задать явно через
+переменные окружения GUNICORN_*. Приложение загружается в мастере до
+fork (preload), так что воркеры делят импортированные модули в общих
+страницах памяти, и перезапуск воркера после max_requests не
+импортирует Django заново.
+"""
+import gc
+import math
+import os
+
+CGROUP_CPU = (
+    ('/sys/fs/cgroup/cpu.max', None),
+    ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us',
+     '/sys/fs/cgroup/cpu/cpu.cfs_period_us'),
+)
+CGROUP_MEMORY = (
+    '/sys/fs/cgroup/memory.max',
+    '/sys/fs/cgroup/memory/memory.limit_in_bytes',
+)
+
+
+def read_first_line(path):
+    try:
+        with open(path) as file:
+            return file.readline().strip()
+    except OSError:
+        return None
+
+
+def cpu_count():
+    """CPU, доступные процессу: affinity, ограниченная квотой cgroup."""
+    count = len(os.sched_getaffinity(0))
+    for quota_path, period_path in CGROUP_CPU:
+        line = read_first_line(quota_path)
+        if not line:
+            continue
+        quota, _, period = line.partition(' ')
+        if period_path is not None:
+            period = read_first_line(period_path)
+        if quota not in ('max', '-1') and period:
+            return max(1, min(count, math.ceil(int(quota) / int(period))))
+    return count
+
+
+def memory_limit():
+    """Доступная память в байтах: лимит cgroup или вся память машины."""
+    with open('/proc/meminfo') as file:
+        limit = int(file.readline().split()[1]) * 1024
+    for path in CGROUP_MEMORY:
+        line = read_first_line(path)
+        if line and line.isdigit():
+            limit = min(limit, int(line))
+    return limit
+
+
+cpus = cpu_count()
+memory = memory_limit()
+worker_memory = int(os.getenv('GUNICORN_WORKER_MEMORY', default=120))
+memory_share = float(os.getenv('GUNICORN_MEMORY_SHARE', default=0.75))
+
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', default='gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', default=max(1, min(
+    2 * cpus + 1, int(memory * memory_share) // (worker_memory << 20)
+))))
+threads = int(os.getenv(
+    'GUNICORN_THREADS', default=max(2, math.ceil(4 * cpus / workers))
+))
+preload_app = os.getenv('GUNICORN_PRELOAD', default='1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+graceful_timeout = timeout
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', default=2000))
+max_requests_jitter = max_requests // 10
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def request_threads(worker):
+    """Сколько запросов воркер обрабатывает одновременно."""
+    if 'uvicorn' in worker.cfg.worker_class_str:
+        from django.conf import settings
+        return settings.ASGI_THREADS
+    return worker.cfg.threads
+
+
+def on_starting(server):
+    server.log.info(
+        'CPU: %s, память: %s МБ, воркеров: %s, потоков: %s, preload: %s',
+        cpus, memory >> 20, server.cfg.workers, server.cfg.threads,
+        server.cfg.preload_app
+    )
+    if server.cfg.preload_app:
+        from api.warmup import warm_imports
+        warm_imports()
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    from api.warmup import warm_worker
+    warm_worker(request_threads(worker))
@@ -0,0 +1,103 @@
+import pytest
+from api.authentication import token_cache
+from django.core.cache import cache
+from foodgram.models import Ingredient, Recipe, RecipeIngredient, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Кэши процесса не переносят ответы и состояния между тестами."""
+    cache.clear()
+    token_cache.clear()
+    yield
+    cache.clear()
+    token_cache.clear()
+
+
+def make_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password='password',
+        first_name=username,
+        last_name=username,
+    )
+
+
+def authorized_client(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@pytest.fixture
+def user():
+    return make_user('user')
+
+
+@pytest.fixture
+def author():
+    return make_user('author')
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    return authorized_client(user)
+
+
+@pytest.fixture
+def author_client(author):
+    return authorized_client(author)
+
+
+@pytest.fixture
+def tags():
+    return [
+        Tag.objects.create(name=name, slug=name, color=color)
+        for name, color in (('breakfast', '#ff0000'), ('dinner', '#00ff00'))
+    ]
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('соль', 'сахар', 'мука')
+    ]
+
+
+@pytest.fixture
+def make_recipes(author, tags, ingredients):
+    """Создаёт рецепты автора с двумя тэгами и двумя ингредиентами."""
+    def make(count, amounts=(10, 20)):
+        start = Recipe.objects.count()
+        recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {start + number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/test.png',
+            ) for number in range(count)
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for recipe in recipes
+            for ingredient, amount in zip(ingredients, amounts)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+            for recipe in recipes for tag in tags
+        )
+        return recipes
+    return make
@@ -0,0 +1,15 @@
+"""Настройки тестов.
+
+Без DB_ENGINE тесты идут на SQLite. Алиас replica_1 в тестах - зеркало
+основной базы (TEST MIRROR) со своим соединением. По умолчанию чтения
+с реплик выключены; тесты роутинга включают их через
+settings.DATABASE_REPLICAS и видят, через какое соединение шли запросы.
+"""
+import os
+
+os.environ.setdefault('DB_ENGINE', 'django.db.backends.sqlite3')
+os.environ.setdefault('DB_REPLICA_NAMES', 'replica')
+
+from backend.settings import *  # noqa: E402,F401,F403
+
+DATABASE_REPLICAS = []
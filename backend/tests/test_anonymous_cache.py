@@ -0,0 +1,99 @@
+import pytest
+from api.asgi import lookup
+from api.cache import RESPONSE_KEY
+from django.core.cache import cache
+from django.core.management import call_command
+
+pytestmark = pytest.mark.django_db
+
+
+def scope(path, host):
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', host.encode())],
+        'http_version': '1.1',
+        'scheme': 'http',
+    }
+
+
+def test_cache_key_includes_site_address(client, make_recipes):
+    make_recipes(1)
+    first = client.get('/api/recipes/', HTTP_HOST='a.example')
+    again = client.get('/api/recipes/', HTTP_HOST='a.example')
+    other = client.get('/api/recipes/', HTTP_HOST='b.example')
+    assert first['X-Cache'] == 'MISS'
+    assert again['X-Cache'] == 'HIT'
+    assert other['X-Cache'] == 'MISS'
+    image = other.json()['results'][0]['image']
+    assert image.startswith('http://b.example/')
+
+
+def test_asgi_lookup_uses_the_same_key(client, make_recipes):
+    make_recipes(1)
+    client.get('/api/recipes/', HTTP_HOST='a.example')
+    namespaces = ('recipes',)
+    assert lookup(scope('/api/recipes/', 'a.example'), namespaces)
+    assert lookup(scope('/api/recipes/', 'b.example'), namespaces) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_favorite_keeps_cached_responses(client, user_client, make_recipes):
+    recipe = make_recipes(1)[0]
+    url = f'/api/recipes/{recipe.pk}/'
+    assert client.get(url).json()['favorites_count'] == 0
+    assert client.get('/api/recipes/')['X-Cache'] == 'MISS'
+    assert user_client.post(f'{url}favorite/').status_code == 201
+    assert client.get(url)['X-Cache'] == 'HIT'
+    assert client.get('/api/recipes/')['X-Cache'] == 'HIT'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_counters_expire_with_their_timeout(client, user_client,
+                                            make_recipes, settings):
+    settings.API_COUNTERS_CACHE_TIMEOUT = 0
+    recipe = make_recipes(1)[0]
+    url = f'/api/recipes/{recipe.pk}/'
+    assert client.get(url).json()['favorites_count'] == 0
+    user_client.post(f'{url}favorite/')
+    response = client.get(url)
+    assert response['X-Cache'] == 'MISS'
+    assert response.json()['favorites_count'] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_ingredients_refreshes_cached_list(client, ingredients, tmp_path):
+    assert len(client.get('/api/ingredients/').json()) == 3
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('перец,г\n', encoding='utf-8')
+    call_command('load_ingredients', str(path))
+    assert len(client.get('/api/ingredients/').json()) == 4
+
+
+def test_responses_vary_on_authorization(client, user_client, tags):
+    for response in (client.get('/api/tags/'), client.get('/api/tags/'),
+                     user_client.get('/api/tags/')):
+        assert 'Authorization' in response['Vary']
+        assert response['Cache-Control'] == 'no-cache'
+
+
+def test_not_modified_only_by_etag(client, tags):
+    first = client.get('/api/tags/')
+    response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 304
+    assert response['ETag'] == first['ETag']
+    response = client.get(
+        '/api/tags/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']
+    )
+    assert response.status_code == 200
+
+
+def test_new_entry_gets_new_etag(client, tags):
+    first = client.get('/api/tags/')
+    key = first['ETag'].strip('"').rsplit('-', 1)[0]
+    cache.delete(RESPONSE_KEY.format(key))
+    second = client.get('/api/tags/', HTTP_IF_NONE_MATCH=first['ETag'])
+    assert second.status_code == 200
+    assert second['ETag'] != first['ETag']
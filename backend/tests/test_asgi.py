@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+from api.asgi import ThreadPoolApplication
+
+
+class StreamingResult:
+    """Потоковый ответ WSGI: второй кусок - только после отправки первого."""
+    streaming = True
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.first_sent = threading.Event()
+
+    def __iter__(self):
+        first, *rest = self.chunks
+        yield first
+        assert self.first_sent.wait(5)
+        yield from rest
+
+
+def scope(method='GET', headers=()):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': '/',
+        'query_string': b'',
+        'headers': list(headers),
+        'http_version': '1.1',
+        'scheme': 'http',
+    }
+
+
+def call(application, scope, messages=()):
+    """Запускает ASGI-приложение, возвращает отправленное и принятое."""
+    pending = list(messages)
+    received = []
+    sent = []
+
+    async def receive():
+        message = pending.pop(0)
+        received.append(message)
+        return message
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return sent, received
+
+
+def test_streaming_response_is_sent_in_chunks():
+    result = StreamingResult([b'a', b'b', b'c'])
+
+    def application(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return result
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if message.get('body') == b'a':
+            result.first_sent.set()
+
+    asyncio.run(ThreadPoolApplication(application, threads=1)(
+        scope(), None, send
+    ))
+    assert sent[0]['status'] == 200
+    assert b'content-length' not in dict(sent[0]['headers'])
+    assert [message['body'] for message in sent[1:]] == [
+        b'a', b'b', b'c', b''
+    ]
+    assert [message.get('more_body', False) for message in sent[1:]] == [
+        True, True, True, False
+    ]
+
+
+def test_request_body_is_read_incrementally():
+    chunks = []
+
+    def application(environ, start_response):
+        stream = environ['wsgi.input']
+        while True:
+            chunk = stream.read(4)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        start_response('200 OK', [])
+        return [b''.join(chunks)]
+
+    sent, received = call(
+        ThreadPoolApplication(application, threads=1),
+        scope('POST', [(b'content-length', b'8')]),
+        [{'type': 'http.request', 'body': b'abcd', 'more_body': True},
+         {'type': 'http.request', 'body': b'efgh'}],
+    )
+    assert chunks == [b'abcd', b'efgh']
+    assert len(received) == 2
+    assert sent[1]['body'] == b'abcdefgh'
+    assert dict(sent[0]['headers'])[b'content-length'] == b'8'
+
+
+def test_unread_body_is_not_received():
+    def application(environ, start_response):
+        start_response('204 No Content', [])
+        return []
+
+    sent, received = call(
+        ThreadPoolApplication(application, threads=1),
+        scope('POST', [(b'content-length', b'4')]),
+        [{'type': 'http.request', 'body': b'abcd'}],
+    )
+    assert sent[0]['status'] == 204
+    assert received == []
+
+
+def test_oversized_body_is_rejected_before_reading(settings):
+    settings.DATA_UPLOAD_MAX_MEMORY_SIZE = 10
+    settings.RECIPE_IMAGE_MAX_SIZE = 3
+    calls = []
+
+    def application(environ, start_response):
+        calls.append(environ)
+        start_response('200 OK', [])
+        return []
+
+    sent, received = call(
+        ThreadPoolApplication(application, threads=1),
+        scope('POST', [(b'content-length', b'15')]),
+        [{'type': 'http.request', 'body': b'x' * 15}],
+    )
+    assert sent[0]['status'] == 413
+    assert calls == []
+    assert received == []
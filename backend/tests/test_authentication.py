@@ -0,0 +1,57 @@
+import pytest
+from api.authentication import TokenCache, shared_key, token_cache
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def shared_tokens(settings):
+    settings.CACHE_SHARED = True
+    settings.TOKEN_CACHE_SHARED = True
+    settings.TOKEN_CACHE_LOCAL = True
+
+
+def test_shared_cache_has_no_password_hash(user, user_client, shared_tokens):
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == 200
+    assert response.json()['username'] == user.username
+    row = cache.get(shared_key(Token.objects.get(user=user).key))
+    assert row is not None
+    assert user.password not in row
+
+
+def test_password_is_loaded_when_needed(user, user_client):
+    user_client.get('/api/users/me/')
+    response = user_client.post('/api/users/set_password/', {
+        'current_password': 'password', 'new_password': 'n3w-Passw0rd!'
+    })
+    assert response.status_code == 204
+    user.refresh_from_db()
+    assert user.check_password('n3w-Passw0rd!')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_revoked_token_is_rejected_by_other_processes(
+        user, user_client, shared_tokens):
+    assert user_client.get('/api/users/me/').status_code == 200
+    key = Token.objects.get(user=user).key
+    other = TokenCache()
+    row = other.get(key)
+    assert row is not None
+    assert other.get(key) == row
+    assert other.get_stats()['local_hits'] == 1
+    Token.objects.filter(key=key).delete()
+    assert other.get(key) is None
+    assert user_client.get('/api/users/me/').status_code == 401
+
+
+def test_tokens_are_not_cached_in_process_cache(user, user_client, settings):
+    settings.CACHE_SHARED = False
+    settings.TOKEN_CACHE_LOCAL = True
+    assert user_client.get('/api/users/me/').status_code == 200
+    key = Token.objects.get(user=user).key
+    assert cache.get(shared_key(key)) is None
+    assert token_cache.get(key) is None
+    assert token_cache.get_stats()['size'] == 0
@@ -0,0 +1,100 @@
+import pytest
+from psycopg2 import OperationalError, extensions
+
+from backend.db.postgresql.base import ConnectionPool
+
+
+class Connection:
+    """Соединение psycopg2 в той мере, в какой его видит пул."""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.autocommit = False
+        self.rolled_back = False
+        self.broken = False
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rolled_back = True
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        return Cursor(self)
+
+
+class Cursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql):
+        if self.connection.broken:
+            raise OperationalError('server closed the connection')
+
+
+def make_pool(size=2, timeout=0.01, recycle=60, check_interval=60):
+    return ConnectionPool(size, timeout, recycle, check_interval)
+
+
+def test_released_connection_is_reused():
+    pool = make_pool()
+    first = pool.acquire(Connection)
+    pool.release(first)
+    assert pool.acquire(Connection) is first
+
+
+def test_release_rolls_back_open_transaction():
+    pool = make_pool()
+    connection = pool.acquire(Connection)
+    connection.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.release(connection)
+    assert connection.rolled_back
+    assert connection.autocommit is True
+    assert pool.acquire(Connection) is connection
+
+
+def test_size_limit_and_timeout():
+    pool = make_pool(size=1)
+    connection = pool.acquire(Connection)
+    with pytest.raises(OperationalError):
+        pool.acquire(Connection)
+    pool.release(connection)
+    assert pool.acquire(Connection) is connection
+
+
+def test_closed_connection_is_replaced():
+    pool = make_pool()
+    connection = pool.acquire(Connection)
+    pool.release(connection)
+    connection.close()
+    replacement = pool.acquire(Connection)
+    assert replacement is not connection
+
+
+def test_idle_connection_is_checked():
+    pool = make_pool(check_interval=0)
+    connection = pool.acquire(Connection)
+    pool.release(connection)
+    connection.broken = True
+    assert pool.acquire(Connection) is not connection
+    assert connection.closed
+
+
+def test_old_connection_is_recycled():
+    pool = make_pool(recycle=0)
+    connection = pool.acquire(Connection)
+    pool.release(connection)
+    assert connection.closed
+    assert pool.acquire(Connection) is not connection
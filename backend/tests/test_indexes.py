@@ -0,0 +1,101 @@
+import pytest
+from django.core.cache import cache
+from foodgram.indexes import (RECIPE_INGREDIENT_CHANGE_KEY,
+                              RECIPE_INGREDIENT_CHANGES_KEY, ingredient_index,
+                              recipe_ingredient_index)
+from foodgram.models import Ingredient, RecipeIngredient
+
+pytestmark = pytest.mark.django_db
+
+
+def test_autocomplete_by_prefix(client, ingredients):
+    Ingredient.objects.create(name='Морская соль', measurement_unit='г')
+    response = client.get('/api/ingredients/', {'name': 'Со'})
+    assert [item['name'] for item in response.json()] == [
+        'соль', 'Морская соль'
+    ]
+
+
+def test_autocomplete_limit(client, ingredients, settings):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'сыр {number}', measurement_unit='г')
+        for number in range(5)
+    )
+    ingredient_index.invalidate()
+    settings.INGREDIENT_SEARCH_LIMIT = 3
+    response = client.get('/api/ingredients/', {'name': 'с'})
+    assert len(response.json()) == 3
+    response = client.get('/api/ingredients/', {'name': 'с', 'limit': 2})
+    assert [item['name'] for item in response.json()] == ['сахар', 'соль']
+    assert len(client.get('/api/ingredients/', {'limit': 2}).json()) == 2
+    detail = client.get(f'/api/ingredients/{ingredients[0].pk}/?limit=1')
+    assert detail.status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_new_ingredient_is_found_after_commit(ingredients):
+    assert ingredient_index.search('пер') == []
+    pepper = Ingredient.objects.create(name='перец', measurement_unit='г')
+    assert ingredient_index.search('пер') == [pepper.pk]
+
+
+def test_index_reloads_after_max_age(ingredients, settings):
+    """Изменение из процесса с другим кэшем видно через INDEX_MAX_AGE."""
+    assert ingredient_index.search('пер') == []
+    salt = ingredients[0]
+    Ingredient.objects.filter(pk=salt.pk).update(name='перец')
+    assert ingredient_index.search('пер') == []
+    ingredient_index._loaded -= settings.INDEX_MAX_AGE
+    assert ingredient_index.search('пер') == [salt.pk]
+
+
+def match(ingredients, missing_max=0):
+    return {
+        recipe_id: missing for recipe_id, _, missing
+        in recipe_ingredient_index.match(
+            [ingredient.pk for ingredient in ingredients], missing_max
+        )
+    }
+
+
+def test_has_ingredients_filter(client, make_recipes, ingredients):
+    recipe = make_recipes(1)[0]
+    response = client.get('/api/recipes/', {
+        'has_ingredients': str(ingredients[0].pk), 'missing_max': 1
+    })
+    [found] = response.json()['results']
+    assert found['id'] == recipe.pk
+    assert found['ingredient_coverage'] == 0.5
+    assert found['missing_ingredients'] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_changes_update_index_in_place(
+        make_recipes, ingredients, monkeypatch):
+    recipe, other = make_recipes(2)
+    salt, sugar, flour = ingredients
+    assert match([salt, sugar]) == {recipe.pk: 0, other.pk: 0}
+
+    def fail(version):
+        raise AssertionError('Индекс перестроен целиком.')
+    monkeypatch.setattr(recipe_ingredient_index, 'load', fail)
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=flour, amount=1)
+    RecipeIngredient.objects.filter(recipe=other, ingredient=salt).delete()
+    assert match([salt, sugar], missing_max=1) == {
+        recipe.pk: 1, other.pk: 0
+    }
+    assert match([flour], missing_max=2) == {recipe.pk: 2}
+    other.delete()
+    assert match([sugar], missing_max=2) == {recipe.pk: 2}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lost_changes_reload_index(make_recipes, ingredients):
+    recipe = make_recipes(1)[0]
+    salt, sugar, flour = ingredients
+    assert match([flour]) == {}
+    RecipeIngredient.objects.create(recipe=recipe, ingredient=flour, amount=1)
+    cache.delete(RECIPE_INGREDIENT_CHANGE_KEY.format(
+        cache.get(RECIPE_INGREDIENT_CHANGES_KEY)
+    ))
+    assert match([salt, sugar, flour]) == {recipe.pk: 0}
@@ -0,0 +1,26 @@
+import pytest
+from api.metrics import registry
+
+pytestmark = pytest.mark.django_db
+
+
+def requests_total(text, method):
+    return sum(
+        float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+        if line.startswith('foodgram_http_requests_total{')
+        and f'method="{method}"' in line
+    )
+
+
+def test_unknown_methods_share_one_label(client, settings):
+    settings.METRICS_TOKEN = 'secret'
+    before = requests_total(registry.render(), 'other')
+    for method in ('FOO', 'BAR', 'PROPFIND'):
+        client.generic(method, '/api/tags/')
+    client.get('/api/tags/')
+    text = client.get(
+        '/api/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+    ).content.decode()
+    assert requests_total(text, 'other') == before + 3
+    assert 'method="FOO"' not in text
+    assert requests_total(text, 'GET') >= 1
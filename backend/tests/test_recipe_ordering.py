@@ -0,0 +1,28 @@
+import pytest
+from foodgram.models import RecipeScore
+
+pytestmark = pytest.mark.django_db
+
+
+def recipe_ids(client, ordering):
+    response = client.get(f'/api/recipes/?ordering={ordering}')
+    assert response.status_code == 200, response.content
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+@pytest.mark.parametrize('ordering', ('popular', 'trending'))
+def test_recipes_created_outside_the_api_are_ranked(client, make_recipes,
+                                                    ordering):
+    recipes = make_recipes(3)
+    assert RecipeScore.objects.count() == 3
+    assert sorted(recipe_ids(client, ordering)) == sorted(
+        recipe.pk for recipe in recipes
+    )
+
+
+@pytest.mark.parametrize('ordering', ('popular', 'trending'))
+def test_ranking_follows_ordering_convention(client, make_recipes, ordering):
+    low, high = make_recipes(2)
+    RecipeScore.objects.filter(recipe=high).update(**{ordering: 5})
+    assert recipe_ids(client, f'-{ordering}') == [high.pk, low.pk]
+    assert recipe_ids(client, ordering) == [low.pk, high.pk]
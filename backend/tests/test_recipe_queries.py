@@ -0,0 +1,83 @@
+import pytest
+from api.authentication import token_cache
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from foodgram.memberships import STATE_KEY
+from foodgram.models import Favorite, ShoppingList
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+def count_queries(client, url):
+    """Запросы к базе на холодных кэшах: токен, связи, фрагменты."""
+    cache.clear()
+    token_cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return len(context), response.json()
+
+
+@pytest.fixture
+def memberships(user, author, make_recipes):
+    """100 рецептов, часть из них в избранном и корзине пользователя."""
+    recipes = make_recipes(100)
+    Favorite.objects.bulk_create(
+        Favorite(user=user, recipe=recipe) for recipe in recipes[::2]
+    )
+    ShoppingList.objects.bulk_create(
+        ShoppingList(user=user, recipe=recipe) for recipe in recipes[::3]
+    )
+    Subscription.objects.create(user=user, author=author)
+    return recipes
+
+
+@pytest.mark.parametrize('fragments', (True, False))
+def test_list_query_budget_does_not_depend_on_page_size(
+        user_client, memberships, settings, fragments):
+    settings.RECIPE_FRAGMENTS = fragments
+    small, small_page = count_queries(user_client, '/api/recipes/?limit=1')
+    large, large_page = count_queries(user_client, '/api/recipes/?limit=100')
+    assert len(small_page['results']) == 1
+    assert len(large_page['results']) == 100
+    assert small == large
+    assert large <= 6
+
+
+def test_list_flags_from_membership_state(user_client, memberships):
+    favorited = {recipe.pk for recipe in memberships[::2]}
+    in_cart = {recipe.pk for recipe in memberships[::3]}
+    _, page = count_queries(user_client, '/api/recipes/?limit=100')
+    for recipe in page['results']:
+        assert recipe['is_favorited'] == (recipe['id'] in favorited)
+        assert recipe['is_in_shopping_cart'] == (recipe['id'] in in_cart)
+        assert recipe['author']['is_subscribed'] is True
+        assert len(recipe['tags']) == 2
+        assert len(recipe['ingredients']) == 2
+
+
+def test_anonymous_list_query_budget(client, memberships):
+    small, _ = count_queries(client, '/api/recipes/?limit=1')
+    large, _ = count_queries(client, '/api/recipes/?limit=100')
+    assert small == large
+    assert large <= 4
+
+
+def test_detail_query_budget(user_client, memberships):
+    queries, recipe = count_queries(
+        user_client, f'/api/recipes/{memberships[0].pk}/'
+    )
+    assert recipe['is_favorited'] is True
+    assert recipe['is_in_shopping_cart'] is True
+    assert queries <= 5
+
+
+@pytest.mark.parametrize('shared', (True, False))
+def test_membership_state_is_cached_only_in_shared_cache(
+        user, user_client, memberships, settings, shared):
+    settings.CACHE_SHARED = shared
+    response = user_client.get('/api/recipes/?limit=1')
+    assert response.status_code == 200
+    assert (cache.get(STATE_KEY.format(user.pk)) is not None) == shared
@@ -0,0 +1,73 @@
+import pytest
+from foodgram.models import ShoppingCartIngredient
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe(make_recipes):
+    return make_recipes(1)[0]
+
+
+def patch(client, recipe, data):
+    return client.patch(f'/api/recipes/{recipe.pk}/', data, format='json')
+
+
+def test_patch_without_ingredients_is_rejected(author_client, recipe, tags):
+    response = patch(author_client, recipe, {
+        'tags': [tag.pk for tag in tags], 'cooking_time': 5
+    })
+    assert response.status_code == 400
+    assert response.json() == {
+        'non_field_errors': ['Необходимо добавить хотя бы 1 игредиент!']
+    }
+
+
+def test_patch_without_cooking_time_is_rejected(
+        author_client, recipe, tags, ingredients):
+    response = patch(author_client, recipe, {
+        'tags': [tag.pk for tag in tags],
+        'ingredients': [{'id': ingredients[0].pk, 'amount': 5}],
+    })
+    assert response.status_code == 400
+    assert 'cooking_time' in response.json()
+
+
+def test_patch_validates_items(author_client, recipe, tags, ingredients):
+    response = patch(author_client, recipe, {
+        'tags': [tags[0].pk, tags[0].pk],
+        'ingredients': [
+            {'id': ingredients[0].pk, 'amount': 5},
+            {'id': 0, 'amount': 5},
+        ],
+        'cooking_time': 5,
+    })
+    assert response.status_code == 400
+    assert response.json() == {'ingredients': [
+        {}, {'id': ['Ингредиент не найден.']}
+    ]}
+
+
+def test_patch_updates_recipe_and_carts(
+        author_client, user_client, user, recipe, tags, ingredients):
+    user_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    response = patch(author_client, recipe, {
+        'tags': [tags[1].pk],
+        'ingredients': [
+            {'id': ingredients[0].pk, 'amount': 15},
+            {'id': ingredients[2].pk, 'amount': 7},
+        ],
+        'cooking_time': 25,
+    })
+    assert response.status_code == 200, response.content
+    data = response.json()
+    assert data['cooking_time'] == 25
+    assert [tag['id'] for tag in data['tags']] == [tags[1].pk]
+    assert {
+        item['id']: item['amount'] for item in data['ingredients']
+    } == {ingredients[0].pk: 15, ingredients[2].pk: 7}
+    assert dict(ShoppingCartIngredient.objects.filter(
+        user=user
+    ).values_list('ingredient_id', 'amount')) == {
+        ingredients[0].pk: 15, ingredients[2].pk: 7
+    }
@@ -0,0 +1,59 @@
+import pytest
+from django.core.cache import cache
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from foodgram.replicas import ALL, PIN_KEY
+
+pytestmark = pytest.mark.django_db(
+    transaction=True, databases=['default', 'replica_1']
+)
+
+
+@pytest.fixture(autouse=True)
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica_1']
+
+
+@pytest.fixture
+def recipe(make_recipes):
+    """Рецепт; создание закрепило всех за основной базой, сбрасываем."""
+    recipe = make_recipes(1)[0]
+    assert cache.get(PIN_KEY.format(ALL))
+    cache.delete(PIN_KEY.format(ALL))
+    return recipe
+
+
+def request(client, method, url):
+    """Ответ и число запросов к основной базе и к реплике."""
+    with CaptureQueriesContext(connections['default']) as default, \
+            CaptureQueriesContext(connections['replica_1']) as replica:
+        response = getattr(client, method)(url)
+    assert response.status_code < 400, response.content
+    return len(default), len(replica)
+
+
+def test_reads_go_to_replica(client, user_client, recipe):
+    assert request(client, 'get', '/api/recipes/')[0] == 0
+    for url in ('/api/recipes/', f'/api/recipes/{recipe.pk}/',
+                '/api/tags/', '/api/ingredients/'):
+        assert request(user_client, 'get', url)[1] > 0
+
+
+def test_writes_and_other_views_go_to_default(user_client, recipe):
+    default, replica = request(
+        user_client, 'post', f'/api/recipes/{recipe.pk}/favorite/'
+    )
+    assert default > 0 and replica == 0
+    default, replica = request(user_client, 'get', '/api/users/me/')
+    assert default > 0 and replica == 0
+
+
+@pytest.mark.parametrize('action', ('favorite', 'shopping_cart'))
+def test_toggle_pins_user_to_default(
+        client, user, user_client, recipe, action):
+    request(user_client, 'post', f'/api/recipes/{recipe.pk}/{action}/')
+    default, replica = request(user_client, 'get', '/api/recipes/')
+    assert default > 0 and replica == 0
+    assert request(client, 'get', '/api/recipes/')[1] > 0
+    cache.delete(PIN_KEY.format(user.pk))
+    assert request(user_client, 'get', '/api/recipes/')[1] > 0
@@ -0,0 +1,69 @@
+import pytest
+from django.core.management import call_command
+from foodgram.models import ShoppingCartIngredient
+
+from .conftest import authorized_client, make_user
+
+pytestmark = pytest.mark.django_db
+
+
+def cart_totals(user):
+    return dict(ShoppingCartIngredient.objects.filter(
+        user=user
+    ).values_list('ingredient__name', 'amount'))
+
+
+@pytest.fixture
+def shoppers(make_recipes):
+    """Три пользователя с одним и тем же рецептом в корзине."""
+    recipe, other = make_recipes(2)
+    users = [make_user(f'shopper{number}') for number in range(3)]
+    for user in users:
+        response = authorized_client(user).post(
+            f'/api/recipes/{recipe.pk}/shopping_cart/'
+        )
+        assert response.status_code == 201
+    response = authorized_client(users[0]).post(
+        f'/api/recipes/{other.pk}/shopping_cart/'
+    )
+    assert response.status_code == 201
+    return users
+
+
+def test_toggles_maintain_totals(shoppers):
+    assert cart_totals(shoppers[0]) == {'соль': 20, 'сахар': 40}
+    assert cart_totals(shoppers[1]) == {'соль': 10, 'сахар': 20}
+
+
+@pytest.mark.parametrize('all_users', (False, True))
+def test_aggregate_counts_each_cart_once(shoppers, all_users):
+    first = shoppers[0]
+    rows = ShoppingCartIngredient.objects.aggregate_from_carts(
+        None if all_users else [first.pk]
+    )
+    totals = sorted(total for user_id, _, total in rows
+                    if user_id == first.pk)
+    assert totals == [20, 40]
+    assert {user_id for user_id, _, _ in rows} == (
+        {user.pk for user in shoppers} if all_users else {first.pk}
+    )
+
+
+def test_rebuild_and_verify(shoppers):
+    expected = {user.pk: cart_totals(user) for user in shoppers}
+    ShoppingCartIngredient.objects.all().delete()
+    call_command('rebuild_shopping_carts')
+    assert {user.pk: cart_totals(user) for user in shoppers} == expected
+    call_command('rebuild_shopping_carts', '--verify')
+
+
+def test_download_formats(shoppers):
+    client = authorized_client(shoppers[1])
+    text = client.get('/api/recipes/download_shopping_cart/?format=txt')
+    assert b''.join(text.streaming_content).decode() == (
+        'сахар - 20 г\nсоль - 10 г'
+    )
+    data = client.get('/api/recipes/download_shopping_cart/?format=json')
+    assert b''.join(data.streaming_content).decode().startswith(
+        '[{"name": "сахар"'
+    )
@@ -0,0 +1,30 @@
+import pytest
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize('limit, expected', (
+    ('2', 2), ('0', 0), ('-1', 0), ('abc', 3), ('', 3),
+))
+def test_subscriptions_recipes_limit(
+        user, author, user_client, make_recipes, limit, expected):
+    make_recipes(3)
+    Subscription.objects.create(user=user, author=author)
+    response = user_client.get(
+        '/api/users/subscriptions/', {'recipes_limit': limit}
+    )
+    assert response.status_code == 200
+    [subscription] = response.json()['results']
+    assert len(subscription['recipes']) == expected
+
+
+@pytest.mark.parametrize('limit, expected', (('1', 1), ('-5', 0), ('x', 3)))
+def test_subscribe_recipes_limit(
+        author, user_client, make_recipes, limit, expected):
+    make_recipes(3)
+    response = user_client.post(
+        f'/api/users/{author.pk}/subscribe/?recipes_limit={limit}'
+    )
+    assert response.status_code == 201
+    assert len(response.json()['recipes']) == expected
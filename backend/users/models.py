@@ -4,6 +4,7 @@ from django.db import models
 
 class User(AbstractUser):
     """Кастомная модель пользователя."""
+    COUNTERS = frozenset(('recipes_count', 'followers_count'))
     USER = 'user'
     ADMIN = 'admin'
     USER_ROLES = (
@@ -24,6 +25,21 @@ class User(AbstractUser):
         blank=False,
         null=False
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
+
+    def refresh_from_db(self, using=None, fields=None):
+        """Отложенные счётчики подгружаются вместе, одним запросом."""
+        if fields is not None and self.COUNTERS.intersection(fields):
+            deferred = self.get_deferred_fields()
+            fields = {*fields, *self.COUNTERS.intersection(deferred)}
+        super().refresh_from_db(using=using, fields=fields)
 
     @property
     def is_user(self):